@@ -127,6 +127,7 @@ class _clusterMember(jimi.db._document):
                     "$project": 
                     { 
                         "maxEndTime" : { "$add" : ["$maxDuration", "$startCheck", 60] },
+                        "queueCheckMaxWait" : { "$add" : [ { "$ifNull" : [ "$queueCheck", 0 ] }, 60 ] },
                         "startCheck" : 1,
                         "maxDuration" : 1,
                         "nextCheckMaxWait" : { "$add" : [ "$nextCheck", 60 ] },
@@ -150,6 +151,8 @@ class _clusterMember(jimi.db._document):
                             }
                         ],
                         "maxEndTime" : { "$lt" :  time.time() },
+                        # Checks waiting in a live worker queue are not failed
+                        "queueCheckMaxWait" : { "$lt" : time.time() },
                         "enabled" : True
                     }
                 }
@@ -78,7 +78,7 @@ def executeCodifyFlow(sessionData,eventsData,codifyData,eventCount=0,maxDuration
                 events = jimi.helpers.typeCast(eventsData)
                 classObject = getObjectFromCode(sessionData,flow)
                 if type(events) != list:
-                    classObject.checkHandler()
+                    classObject.checkHandler(stream=False)
                     events = classObject.result["events"]
                     if eventCount>0:
                         events = events[:eventCount]
@@ -12,6 +12,7 @@ from types import ModuleType, FunctionType
 from gc import get_referents
 import json
 import ast
+import copy
 import time
 import datetime
 from bson.objectid import ObjectId 
@@ -26,12 +27,19 @@ regexEvalString = re.compile("(\%\%([^%]*)\%\%)")
 regexDict = re.compile("^([a-zA-Z]+)\[.*\]")
 regexDictKeys = re.compile("(\[\"?([^\]\"]*)\"?\])")
 regexFunction = re.compile("^([a-zA-Z0-9]*)\(.*\)")
-regexFunctionOpen = re.compile("^([a-zA-Z0-9]*)\(.*")
 regexCommor = re.compile(",(?=(?:[^\"]*\"[^\"]*\")*[^\"]*$)")
 regexInt = re.compile("^(-|)[0-9]+$")
 regexFloat = re.compile("^(-|)[0-9]+\.[0-9]+$")
 regexString = re.compile("^\".*\"$")
 
+templateCacheSize = 4096
+expressionCacheSize = 4096
+# Events of a run whose memoised values are held at once, events are normally dropped once their flow finishes
+expressionMemoEvents = 1000
+
+# Functions with side effects or results that change over time, calls to these are never memoized
+memoUnsafeFunctions = set(["now","day","year","month","dt","isLastDay","dateBetween","timeBetween","secureRandom","append","remove"])
+
 baseDir = os.getcwd()
 
 systemProperties = ["classID","workerID","acl","scope","lastUpdateTime","creationTime","createdBy","attemptCount","autoRestartCount","clusterSet","systemID","startCheck","scope"]
@@ -68,14 +76,51 @@ def defineVars(varDefinitions,dicts={},functionSafeList=functionSafeList):
     return result
 
 def evalString(varString,dicts={},functionSafeList=functionSafeList):
-    results = varString
-    evalMatches = regexEvalString.findall(varString)
-    if len(evalMatches) == 0:
-        results = typeCast(varString)
-    for evalMatch in evalMatches:
-        if results is not None:
-            results = typeCast(results.replace(evalMatch[0],str(typeCast(evalMatch[1],dicts,functionSafeList))))
-    return results
+    return compileTemplate(varString).render(dicts,functionSafeList)
+
+# Strings are split once into literal and %%expression%% segments and cached by string
+@functools.lru_cache(maxsize=templateCacheSize)
+def compileTemplate(varString):
+    return _template(varString)
+
+class _template():
+    __slots__ = ("source","segments","dynamic","pure","constant","value")
+
+    def __init__(self,varString):
+        self.source = varString
+        self.segments = []
+        index = 0
+        for evalMatch in regexEvalString.finditer(varString):
+            if evalMatch.start() > index:
+                self.segments.append((False,varString[index:evalMatch.start()]))
+            self.segments.append((True,compileExpression(evalMatch.group(2))))
+            index = evalMatch.end()
+        if index < len(varString):
+            self.segments.append((False,varString[index:]))
+        self.dynamic = any(segment[0] for segment in self.segments)
+        self.pure = len(self.segments) == 1 and self.dynamic
+        # Plain strings are typecast once unless the result could change between renders ( function calls ) or be mutated by the caller ( lists and dicts )
+        self.constant = not self.dynamic and not ( varString and ( regexFunction.search(varString) or varString[0] in "[{" ) )
+        if self.constant:
+            self.value = typeCast(varString)
+
+    def render(self,dicts={},functionSafeList=functionSafeList):
+        if self.constant:
+            return self.value
+        if not self.dynamic:
+            return typeCast(self.source)
+        if self.pure:
+            return castResult(evaluateExpression(self.segments[0][1],dicts,functionSafeList))
+        return castValue("".join([ str(evaluateExpression(value,dicts,functionSafeList)) if expression else value for expression, value in self.segments ]))
+
+# Type cast an evaluated value as if it had been rendered into a string, keeps native types without the string round trip where the result is the same
+def castResult(value):
+    valueType = type(value)
+    if valueType is str:
+        return castValue(value)
+    if value is None or valueType is int or valueType is bool:
+        return value
+    return castValue(str(value))
 
 def evalDict(varDict,dicts={},functionSafeList=functionSafeList):
     result = {}
@@ -107,141 +152,247 @@ def evalList(varList,dicts={},functionSafeList=functionSafeList):
 
 # Get dict values from string dict
 def getDictValue(varString,dicts={}):
-    def nested_dict_get(dictionary, keys):
-        return functools.reduce(lambda d, key: d.get(key) if d else None, keys, dictionary)
+    dictPath = compileDictPath(varString)
+    if dictPath:
+        return dictPath.evaluate(dicts)
+    return None
+
+# Dict path strings i.e. data["event"]["a"][0] are compiled once into a cached accessor holding the dict name and key chain
+@functools.lru_cache(maxsize=expressionCacheSize)
+def compileDictPath(varString):
+    return parseDictPath(varString)
 
+def parseDictPath(varString):
     if regexDict.search(varString):
-        dictName = varString.split("[")[0]
-        if dictName in dicts:
-            dictKeys = []
-            for key in regexDictKeys.findall(varString):
-                dictKeys.append(key[1])
+        return _dictPath(varString.split("[")[0],[ key[1] for key in regexDictKeys.findall(varString) ])
+    return None
+
+class _dictPath():
+    __slots__ = ("dictName","keys","memoize")
+
+    def __init__(self,dictName,keys):
+        self.dictName = dictName
+        # Each key is stored alongside its list index form so list access does not need to convert per lookup
+        self.keys = []
+        for key in keys:
             try:
-                return typeCast(nested_dict_get(dicts[dictName],dictKeys))
-            except AttributeError:
+                self.keys.append((key,int(key)))
+            except ValueError:
+                self.keys.append((key,None))
+        # Only event values are fixed for the life of an event, var, plugin and action change between actions
+        self.memoize = dictName == "data" and len(self.keys) > 0 and self.keys[0][0] == "event"
+
+    def evaluate(self,dicts={},functionSafeList=None):
+        try:
+            currentValue = dicts[self.dictName]
+        except KeyError:
+            return None
+        walkedList = False
+        for key, index in self.keys:
+            if not currentValue:
+                return None
+            if type(currentValue) is dict:
+                currentValue = currentValue.get(key)
+            elif type(currentValue) is list:
+                if index is None:
+                    return None
                 try:
-                    currentValue = dicts[dictName]
-                    for key in dictKeys:
-                        if type(currentValue) is dict:
-                            currentValue = currentValue[key]
-                        elif type(currentValue) is list:
-                            currentValue = currentValue[int(key)]
-                        else:
-                            return None
-                except:
+                    currentValue = currentValue[index]
+                except IndexError:
                     return None
-                return currentValue
-    return None
-
-# Type cast string into varible types, includes dict and function calls
-def typeCast(varString,dicts={},functionSafeList=functionSafeList):
+                walkedList = True
+            elif walkedList:
+                return None
+            else:
+                try:
+                    currentValue = currentValue.get(key)
+                except AttributeError:
+                    return None
+        # Values reached through lists are returned untouched, values reached through dicts alone are type cast
+        if walkedList:
+            return currentValue
+        return castValue(currentValue)
+
+# Expressions ( the text typeCast accepts ) compiled once into a cached node that is evaluated against dicts
+@functools.lru_cache(maxsize=expressionCacheSize)
+def compileExpression(varString):
+    return parseExpression(varString)
+
+# Only expressions from definitions are cached, runtime values set cached=False so event data never enters the dict path cache
+def parseExpression(varString,cached=True):
     if type(varString) == str and varString:
         # String defined
         if varString[0] == "\"" and varString[-1] == "\"":
-            return str(varString[1:-1])
+            return _constantExpression(str(varString[1:-1]))
         # Int
         if regexInt.match(varString):
-            return int(varString)
+            return _constantExpression(int(varString))
         # Float
         if regexFloat.match(varString):
-            return float(varString)
+            return _constantExpression(float(varString))
         # Bool
         lower = varString.lower()
         if lower == "true":
-            return True
+            return _constantExpression(True)
         if lower == "false":
-            return False
+            return _constantExpression(False)
         # None
         if lower == "none" or lower == "null":
-            return None
+            return _constantExpression(None)
         # Dict
         if regexDict.match(varString):
-            return getDictValue(varString,dicts)
+            if cached:
+                return compileDictPath(varString)
+            return parseDictPath(varString)
         # Attempt to cast dict and list
         if varString[0] == "{" or varString[0] == "[":
             try:
-                return ast.literal_eval(varString)
+                return _literalExpression(ast.literal_eval(varString))
             except:
                 pass
         # Function
         if regexFunction.search(varString):
-            functionName = varString.split("(")[0]
-            if functionName in functionSafeList:
-                functionValue = varString[(len(functionName)+1):-1]
-
-                functionArgs = []
-
-                tempArg = ""
-                index = 0
-                # Decoding string function arguments to single arguments for typeCasting - Regex maybe faster but has to handle encaspulation of " \" [ ' (, old search regex only worked with "
-                while index <= len(functionValue)-1:
-                    if functionValue[index] == "\"":
-                        tempArg += functionValue[index]
-                        index += 1
-                        while index <= len(functionValue)-1:
-                            if functionValue[index] != "\"":
-                                tempArg += functionValue[index]
-                                index += 1
-                            else:
-                                tempArg += functionValue[index]
-                                if (functionValue[index-1] != "\\") or (functionValue[index-1] == "\\" and functionValue[index-2] == "\\"):
-                                    tempArg = tempArg.replace("\\\\","\\")
-                                    break
-                                index += 1
-                    elif functionValue[index] == "[":
-                        while index <= len(functionValue)-1:
-                            if functionValue[index] != "]":
-                                tempArg += functionValue[index]
-                                index += 1
-                            else:
-                                tempArg += functionValue[index]
-                                index += 1
-                                break
-                    else:
-                        functionFound = 0
-                        inQuote = False
-                        while index <= len(functionValue)-1:
-                            if functionFound > 0:
-                                if functionValue[index] == "\"":
-                                    if functionValue[index-1] != "\\" and functionValue[index-2] != "\\":
-                                        inQuote = not inQuote
-                                if not inQuote: 
-                                    if functionValue[index] == "(":
-                                        functionFound += 1
-                                    elif functionValue[index] == ")":
-                                        functionFound -= 1
-                                        if functionFound == 0:
-                                            tempArg += functionValue[index]
-                                            index += 1
-                                            break
-                                tempArg += functionValue[index]
-                                index += 1
-                            elif functionValue[index] == "(":
-                                tempArg += functionValue[index]
-                                index += 1
-                                if regexFunctionOpen.search(tempArg):
-                                    functionFound += 1
-                            elif functionValue[index] != "," and functionValue[index] != ")":
-                                tempArg += functionValue[index]
-                                index += 1
-                            else:
-                                break
-                    
-                    if tempArg != "":
-                        value = typeCast(tempArg.strip(),dicts,functionSafeList)
-                        functionArgs.append(value)
-                        tempArg = ""
-                    index+=1
-
-                # Catch any execution errors within functions
-                try:
-                    if len(functionArgs) > 0:
-                        a = functionSafeList[functionName](*functionArgs)
-                        return a
-                    else:
-                        return functionSafeList[functionName]()
-                except Exception as e:
-                    raise jimi.exceptions.functionCallFailure(functionName,''.join(traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)))
+            functionCall = parseFunctionCall(varString,cached)
+            if functionCall:
+                return functionCall
+    # Default to exsiting
+    return _constantExpression(varString)
+
+# Splits function call text into its name and argument nodes i.e. concat(data["event"]["a"],"x") returns None when the brackets do not close at the end of the string
+def parseFunctionCall(varString,cached=True):
+    functionName = varString.split("(")[0]
+    functionArgs = []
+    brackets = []
+    inQuote = False
+    argStart = len(functionName) + 1
+    index = argStart
+    while index < len(varString):
+        char = varString[index]
+        if inQuote:
+            if char == "\\":
+                index += 1
+            elif char == "\"":
+                inQuote = False
+        elif char == "\"":
+            inQuote = True
+        elif char in "([{":
+            brackets.append(char)
+        elif char in ")]}":
+            if not brackets:
+                if char != ")" or index != len(varString) - 1:
+                    return None
+                functionArgs.append(varString[argStart:index])
+                break
+            brackets.pop()
+        elif char == "," and not brackets:
+            functionArgs.append(varString[argStart:index])
+            argStart = index + 1
+        index += 1
+    else:
+        return None
+    argNodes = []
+    for functionArg in functionArgs:
+        functionArg = functionArg.strip()
+        if functionArg:
+            if functionArg[0] == "\"" and functionArg[-1] == "\"":
+                functionArg = functionArg.replace("\\\\","\\")
+            argNodes.append(parseExpression(functionArg,cached))
+    return _functionCall(functionName,argNodes,varString)
+
+# Type cast a runtime value i.e. event data, unlike typeCast the compiled result is not cached
+def castValue(value):
+    if type(value) == str and value:
+        expression = parseExpression(value,False)
+        # Freshly parsed so the literal value does not need copying
+        if type(expression) is _literalExpression:
+            return expression.value
+        return expression.evaluate({},functionSafeList)
+    return value
+
+class _constantExpression():
+    __slots__ = ("value",)
+    memoize = False
+
+    def __init__(self,value):
+        self.value = value
+
+    def evaluate(self,dicts={},functionSafeList=None):
+        return self.value
+
+# List and dict literals are parsed once, each evaluation returns its own copy as callers are free to modify the result
+class _literalExpression():
+    __slots__ = ("value",)
+    memoize = False
+
+    def __init__(self,value):
+        self.value = value
+
+    def evaluate(self,dicts={},functionSafeList=None):
+        return copy.deepcopy(self.value)
+
+class _functionCall():
+    __slots__ = ("functionName","args","source","memoize")
+
+    def __init__(self,functionName,args,source):
+        self.functionName = functionName
+        self.args = args
+        self.source = source
+        self.memoize = functionName not in memoUnsafeFunctions and all([ arg.memoize or type(arg) in (_constantExpression,_literalExpression) for arg in args ])
+
+    def evaluate(self,dicts={},functionSafeList=functionSafeList):
+        if self.functionName not in functionSafeList:
+            return self.source
+        functionArgs = [ arg.evaluate(dicts,functionSafeList) for arg in self.args ]
+        # Catch any execution errors within functions
+        try:
+            return functionSafeList[self.functionName](*functionArgs)
+        except Exception as e:
+            raise jimi.exceptions.functionCallFailure(self.functionName,''.join(traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)))
+
+# Evaluates a compiled expression, when the run carries an expression memo event lookups and function calls on them are only run once per event
+def evaluateExpression(expression,dicts={},functionSafeList=functionSafeList):
+    if expression.memoize and functionSafeList is jimi.function.systemFunctions:
+        try:
+            expressionMemo = dicts["persistentData"]["system"]["expressionMemo"]
+        except (KeyError,TypeError):
+            expressionMemo = None
+        if expressionMemo:
+            return expressionMemo.evaluate(expression,dicts,functionSafeList)
+    return expression.evaluate(dicts,functionSafeList)
+
+# Memo held once per run within the system persistentData so it is never visible to actions or templates, values are kept per event object and keyed by compiled expression
+class _expressionMemo():
+    __slots__ = ("events",)
+
+    def __init__(self):
+        self.events = {}
+
+    # Called once the flow of an event has finished or an action has run as it may have written to the event
+    def clear(self,event):
+        self.events.pop(id(event),None)
+
+    def evaluate(self,expression,dicts,functionSafeList):
+        event = dicts["data"].get("event")
+        # The event is held with its values so an id reused by a later event is never matched
+        state = self.events.get(id(event))
+        if state is None or state[0] is not event:
+            if len(self.events) >= expressionMemoEvents:
+                self.events.clear()
+            state = (event,{})
+            self.events[id(event)] = state
+        try:
+            return state[1][expression]
+        except KeyError:
+            value = expression.evaluate(dicts,functionSafeList)
+            state[1][expression] = value
+            return value
+
+# Type cast string into varible types, includes dict and function calls. Runtime values i.e. stored globals pass cached=False so they are parsed without filling the expression caches
+def typeCast(varString,dicts={},functionSafeList=functionSafeList,cached=True):
+    if type(varString) == str and varString:
+        if not cached:
+            return parseExpression(varString,False).evaluate(dicts,functionSafeList)
+        return evaluateExpression(compileExpression(varString),dicts,functionSafeList)
     # Default to exsiting
     return varString
 
@@ -1,5 +1,6 @@
 from math import log
 import time
+import inspect
 
 import jimi
 
@@ -47,43 +48,93 @@ class _action(jimi.db._document):
         return result
 
     def runHandler(self,data=None,debug=False):
+        startTime = self.runHandlerStart()
+        logicResult = self.runHandlerLogic(data,debug)
+        actionResult = None
+        if logicResult[0]:
+            actionResult = self.doAction(data)
+        return self.runHandlerEnd(data,debug,startTime,logicResult,actionResult)
+
+    # Coroutine equivalent of runHandler, synchronous actions are offloaded to the event loop threads as a whole
+    async def runHandlerAsync(self,data=None,debug=False):
+        if not self.isAsync():
+            return await jimi.workers.runInThread(self.runHandler,data,debug)
+        # Only run itself is awaited on the event loop, logic, var definitions and audit writes are offloaded
+        startTime = await jimi.workers.runInThread(self.runHandlerStart)
+        logicResult = await jimi.workers.runInThread(self.runHandlerLogic,data,debug)
+        actionResult = None
+        if logicResult[0]:
+            actionResult = await self.run(data["flowData"],data["persistentData"], { "result" : False, "rc" : -1, "actionID" : self._id, "data" : {} })
+        return await jimi.workers.runInThread(self.runHandlerEnd,data,debug,startTime,logicResult,actionResult)
+
+    # Batch equivalent of runHandler, logic and var definitions are still evaluated per event and every event gets its own action result
+    def runBatchHandler(self,dataList):
+        startTimes = [ self.runHandlerStart() for data in dataList ]
+        logicResults = [ self.runHandlerLogic(data,False) for data in dataList ]
+        passedDataList = [ data for data, logicResult in zip(dataList,logicResults) if logicResult[0] ]
+        passedActionResults = []
+        if passedDataList:
+            passedActionResults = self.runBatch(passedDataList)
+            if type(passedActionResults) is not list or len(passedActionResults) != len(passedDataList):
+                raise ValueError("runBatch must return one action result per event")
+        passedActionResults.reverse()
+        actionResults = []
+        for data, startTime, logicResult in zip(dataList,startTimes,logicResults):
+            actionResult = None
+            if logicResult[0]:
+                actionResult = passedActionResults.pop()
+            actionResults.append(self.runHandlerEnd(data,False,startTime,logicResult,actionResult))
+        return actionResults
+
+    # Actions able to process many events in one call override runBatch, it is given the data of every event reaching the action within a batch and returns one action result per event in the same order
+    def runBatch(self,dataList):
+        return [ self.doAction(data) for data in dataList ]
+
+    def hasBatch(self):
+        return type(self).runBatch is not _action.runBatch
+
+    # Actions defining async def run are awaited on the event loop unless they override doAction
+    def isAsync(self):
+        return inspect.iscoroutinefunction(self.run) and type(self).doAction is _action.doAction
+
+    def runHandlerStart(self):
         ####################################
         #              Header              #
         ####################################
+        startTime = 0
         if self.log:
-            startTime = 0
             startTime = time.time()
             jimi.audit._audit().add("action","start",{ "action_id" : self._id, "action_name" : self.name })
         ####################################
+        return startTime
+
+    # Returns logic result, eval and explain text
+    def runHandlerLogic(self,data,debug):
+        if not self.logicString:
+            return True, None, None
+        logicResult = jimi.logic.ifEval(self.logicString, { "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"]}, debug=debug)
+        if debug:
+            return logicResult
+        return logicResult, None, None
 
-        if self.logicString:
-            logicResult = jimi.logic.ifEval(self.logicString, { "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"]}, debug=debug)
+    def runHandlerEnd(self,data,debug,startTime,logicResult,actionResult):
+        logicResult, evalLogic, explainLogic = logicResult
+        if logicResult:
+            # Values memoised for the event are dropped as the action may have written to it
+            try:
+                data["persistentData"]["system"]["expressionMemo"].clear(data["flowData"].get("event"))
+            except KeyError:
+                pass
+            if debug and self.logicString:
+                actionResult["logic_eval"] = evalLogic
+                actionResult["logic_explain"] = explainLogic
+            if self.varDefinitions:
+                jimi.variable.varEvalScopes(self,data,{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"], "action" : actionResult})
+        else:
             if debug:
-                evalLogic = logicResult[1]
-                explainLogic = logicResult[2]
-                logicResult = logicResult[0]
-            if logicResult:
-                actionResult = self.doAction(data)
-                if debug:
-                    actionResult["logic_eval"] = evalLogic
-                    actionResult["logic_explain"] = explainLogic
-                if self.varDefinitions:
-                    data["flowData"]["var"] = jimi.variable.varEval(self.varDefinitions,data["flowData"]["var"],{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"], "action" : actionResult},0)
-                    data["eventData"]["var"] = jimi.variable.varEval(self.varDefinitions,data["eventData"]["var"],{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"], "action" : actionResult},1)
-                    data["conductData"]["var"] = jimi.variable.varEval(self.varDefinitions,data["conductData"]["var"],{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"], "action" : actionResult},2)
-                    data["persistentData"]["var"] = jimi.variable.varEval(self.varDefinitions,data["persistentData"]["var"],{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"], "action" : actionResult},3)
+                actionResult = { "result" : False, "rc" : -100, "msg" : "Logic returned: False", "logic_string" : self.logicString, "logic_eval" : evalLogic, "logic_explain" : explainLogic }
             else:
-                if debug:
-                    actionResult = { "result" : False, "rc" : -100, "msg" : "Logic returned: False", "logic_string" : self.logicString, "logic_eval" : evalLogic, "logic_explain" : explainLogic }
-                else:
-                    actionResult = { "result" : False, "rc" : -100, "msg" : "Logic returned: False", "logic_string" : self.logicString }
-        else:
-            actionResult = self.doAction(data)
-            if self.varDefinitions:
-                data["flowData"]["var"] = jimi.variable.varEval(self.varDefinitions,data["flowData"]["var"],{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"], "action" : actionResult},0)
-                data["eventData"]["var"] = jimi.variable.varEval(self.varDefinitions,data["eventData"]["var"],{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"], "action" : actionResult},1)
-                data["conductData"]["var"] = jimi.variable.varEval(self.varDefinitions,data["conductData"]["var"],{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"], "action" : actionResult},2)
-                data["persistentData"]["var"] = jimi.variable.varEval(self.varDefinitions,data["persistentData"]["var"],{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"], "action" : actionResult},3)
+                actionResult = { "result" : False, "rc" : -100, "msg" : "Logic returned: False", "logic_string" : self.logicString }
 
         ####################################
         #              Footer              #
@@ -96,6 +147,9 @@ class _action(jimi.db._document):
 
     def doAction(self,data):
         actionResult = self.run(data["flowData"],data["persistentData"], { "result" : False, "rc" : -1, "actionID" : self._id, "data" : {} })
+        # Async actions reached from a synchronous flow are run to completion on the event loop
+        if inspect.iscoroutine(actionResult):
+            actionResult = jimi.workers.runCoroutine(actionResult)
         return actionResult
 
     def run(self,data,persistentData,actionResult):
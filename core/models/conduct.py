@@ -1,6 +1,11 @@
 import time
 import copy
+import weakref
 import traceback
+import threading
+import asyncio
+import concurrent.futures
+from concurrent.futures import ThreadPoolExecutor
 
 import jimi
 
@@ -12,6 +17,9 @@ class _conduct(jimi.db._document):
     log = bool()
     comment = str()
     statics = dict()
+    memoizeExpressions = bool()
+    parallelBranches = bool()
+    asyncFlow = bool()
 
     _dbCollection = jimi.db.db["conducts"]
 
@@ -19,10 +27,7 @@ class _conduct(jimi.db._document):
         # Cached lookups to limit reloading the same actions
         jimi.cache.globalCache.newCache("actionCache")
         jimi.cache.globalCache.newCache("triggerCache")
-        jimi.cache.globalCache.newCache("triggeredFlowTriggers")
-        jimi.cache.globalCache.newCache("triggeredFlowActions")
-        jimi.cache.globalCache.newCache("triggeredFlowFlows")
-        jimi.cache.globalCache.newCache("flowDict")
+        jimi.cache.globalCache.newCache("executionPlanCache")
         return super(_conduct, self).__init__(restrictClass)
 
     # Override parent new to include name var, parent class new run after class var update
@@ -50,11 +55,125 @@ class _conduct(jimi.db._document):
         return True
 
     def triggerBatchHandler(self,triggerID,dataBatch,actionIDType=False,flowIDType=False,flowDebugSession=None):
+        if not flowDebugSession and dataBatch and "flowDebugSession" not in dataBatch[0]["persistentData"]["system"]:
+            # Conducts with actions implementing runBatch move the whole batch through the flow together
+            plan = self.getExecutionPlan()
+            if plan.batch:
+                self.triggerBatchFlowHandler(triggerID,dataBatch,actionIDType,flowIDType)
+                return
+            # Async conducts keep every event of the batch in flight on the event loop
+            if self.asyncFlow and not jimi.workers.inEventLoop():
+                jimi.workers.runCoroutine(self.triggerBatchHandlerAsync(triggerID,dataBatch,actionIDType,flowIDType))
+                return
+        # Only the per event path takes the filter results, so no logic is evaluated twice for an event
+        filterResults = None
+        if not actionIDType and not flowIDType and not flowDebugSession and not self.log and len(dataBatch) > 1:
+            dataBatch, filterResults = self.triggerBatchFilter(triggerID,dataBatch)
+        for index, data in enumerate(dataBatch):
+            self.triggerHandler(triggerID,data,actionIDType,flowIDType,flowDebugSession,filterResults[index] if filterResults else None)
+
+    def triggerBatchFlowHandler(self,triggerID,dataBatch,actionIDType=False,flowIDType=False):
+        ####################################
+        #              Header              #
+        ####################################
+        if self.log:
+            startTime = 0
+            startTime = time.time()
+            jimi.audit._audit().add("conduct","trigger_start",{ "conduct_id" : self._id, "conduct_name" : self.name, "trigger_id" : triggerID, "batch_size" : len(dataBatch) })
+        ####################################
+
+        for data in dataBatch:
+            plan, triggeredNodes = self.triggerHandlerPrepare(triggerID,data,actionIDType,flowIDType,False)
+        for triggeredNode in triggeredNodes:
+            self.flowBatchHandler(plan,triggeredNode,dataBatch)
+        for data in dataBatch:
+            self.triggerHandlerFinish(data)
+
+        ####################################
+        #              Footer              #
+        ####################################
+        if self.log:
+            jimi.audit._audit().add("conduct","trigger_end",{ "conduct_id" : self._id, "conduct_name" : self.name, "trigger_id" : triggerID, "batch_size" : len(dataBatch), "duration" : ( time.time() - startTime ) })
+        ####################################
+
+    async def triggerBatchHandlerAsync(self,triggerID,dataBatch,actionIDType=False,flowIDType=False):
+        asyncEvents = jimi.settings.getSetting("conduct","asyncEvents")
+        if not asyncEvents:
+            asyncEvents = 1000
+        eventLimit = asyncio.Semaphore(asyncEvents)
+        async def limitedTriggerHandler(data):
+            async with eventLimit:
+                await self.triggerHandlerAsync(triggerID,data,actionIDType,flowIDType)
+        # Every event is waited on so none is still running once the first error is raised
+        for result in await asyncio.gather(*[ limitedTriggerHandler(data) for data in dataBatch ],return_exceptions=True):
+            if isinstance(result,BaseException):
+                raise result
+
+    # Drops events that would not pass the trigger logic or any link leaving the trigger, evaluating each logic string once over the whole batch. Returns the remaining events along with their results keyed by triggered node, False when the trigger logic failed otherwise the result of every link
+    def triggerBatchFilter(self,triggerID,dataBatch):
+        plan = self.getExecutionPlan()
+        if plan.codify:
+            return dataBatch, None
+        triggeredNodes = plan.triggerNodes.get(triggerID)
+        if not triggeredNodes:
+            return dataBatch, None
+        for triggeredNode in triggeredNodes:
+            currentTrigger = triggeredNode.object
+            # Link logic can depend on vars set by the trigger so these cannot be evaluated ahead of flowHandler
+            if not currentTrigger or currentTrigger.varDefinitions:
+                return dataBatch, None
+
+        dictsList = []
         for data in dataBatch:
-            self.triggerHandler(triggerID,data,actionIDType,flowIDType,flowDebugSession)
+            data["persistentData"]["system"]["conduct"] = self
+            # Set as flowHandler would before the trigger logic so links reading them get the same result
+            data["flowData"]["conductID"] = self._id
+            data["flowData"]["action"] = { "result" : True, "rc" : 1337 }
+            if self.statics:
+                data["flowData"]["var"]["statics"] = {}
+                for staticName, staticValue in self.statics.items():
+                    data["flowData"]["var"]["statics"][staticName] = staticValue
+            dictsList.append({ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"]})
+
+        nodeResults = []
+        try:
+            for triggeredNode in triggeredNodes:
+                if triggeredNode.object.logicString:
+                    candidates = [ index for index, result in enumerate(jimi.logic.ifEvalBatch(triggeredNode.object.logicString,dictsList)) if result ]
+                else:
+                    candidates = list(range(len(dataBatch)))
+                linkResults = []
+                for nextNode, linkLogic, compiledLogic, parallel in triggeredNode.next:
+                    # flowHandler starts every event with action result True and rc 1337 so bool and int links are decided without evaluation
+                    if type(linkLogic) is bool:
+                        linkResults.append([ linkLogic == True for index in candidates ])
+                    elif type(linkLogic) is int:
+                        linkResults.append([ linkLogic == 1337 for index in candidates ])
+                    elif type(linkLogic) is str and linkLogic.startswith("if"):
+                        linkResults.append(jimi.logic.ifEvalBatch(linkLogic,[ dictsList[index] for index in candidates ]))
+                    elif linkLogic == "*":
+                        linkResults.append([ True for index in candidates ])
+                    else:
+                        linkResults.append([ False for index in candidates ])
+                results = [ False for data in dataBatch ]
+                for candidateIndex, index in enumerate(candidates):
+                    results[index] = tuple([ bool(linkResult[candidateIndex]) for linkResult in linkResults ])
+                nodeResults.append((triggeredNode,results))
+        except Exception:
+            # Leave error handling and reporting to the per event flowHandler
+            return dataBatch, None
+        filteredBatch = []
+        filterResults = []
+        for index, data in enumerate(dataBatch):
+            eventResults = { triggeredNode : results[index] for triggeredNode, results in nodeResults }
+            if any([ result and any(result) for result in eventResults.values() ]):
+                filteredBatch.append(data)
+                filterResults.append(eventResults)
+        return filteredBatch, filterResults
 
     # actionIDType=True uses actionID instead of triggerID
-    def triggerHandler(self,triggerID,data,actionIDType=False,flowIDType=False,flowDebugSession=None):
+    # filterResults holds the triggerBatchFilter results by triggered node, those nodes skip their trigger and link logic
+    def triggerHandler(self,triggerID,data,actionIDType=False,flowIDType=False,flowDebugSession=None,filterResults=None):
         ####################################
         #              Header              #
         ####################################
@@ -64,6 +183,49 @@ class _conduct(jimi.db._document):
             jimi.audit._audit().add("conduct","trigger_start",{ "conduct_id" : self._id, "conduct_name" : self.name, "trigger_id" : triggerID })
         ####################################
 
+        debugSession = flowDebugSession or "flowDebugSession" in data["persistentData"]["system"]
+        plan, triggeredNodes = self.triggerHandlerPrepare(triggerID,data,actionIDType,flowIDType,debugSession)
+
+        if self.asyncFlow and not debugSession and not plan.codify and not jimi.workers.inEventLoop():
+            jimi.workers.runCoroutine(self.flowHandlersAsync(plan,triggeredNodes,data))
+        else:
+            for triggeredNode in triggeredNodes:
+                if filterResults and triggeredNode in filterResults:
+                    self.flowHandler(plan,triggeredNode,data,flowDebugSession=flowDebugSession,filterResult=filterResults[triggeredNode])
+                else:
+                    self.flowHandler(plan,triggeredNode,data,flowDebugSession=flowDebugSession)
+        self.triggerHandlerFinish(data)
+
+        ####################################
+        #              Footer              #
+        ####################################
+        if self.log:
+            jimi.audit._audit().add("conduct","trigger_end",{ "conduct_id" : self._id, "conduct_name" : self.name, "trigger_id" : triggerID, "duration" : ( time.time() - startTime ) })
+        ####################################
+
+    async def triggerHandlerAsync(self,triggerID,data,actionIDType=False,flowIDType=False):
+        ####################################
+        #              Header              #
+        ####################################
+        if self.log:
+            startTime = 0
+            startTime = time.time()
+            await jimi.workers.runInThread(jimi.audit._audit().add,"conduct","trigger_start",{ "conduct_id" : self._id, "conduct_name" : self.name, "trigger_id" : triggerID })
+        ####################################
+
+        plan, triggeredNodes = await jimi.workers.runInThread(self.triggerHandlerPrepare,triggerID,data,actionIDType,flowIDType,False)
+        await self.flowHandlersAsync(plan,triggeredNodes,data)
+        self.triggerHandlerFinish(data)
+
+        ####################################
+        #              Footer              #
+        ####################################
+        if self.log:
+            await jimi.workers.runInThread(jimi.audit._audit().add,"conduct","trigger_end",{ "conduct_id" : self._id, "conduct_name" : self.name, "trigger_id" : triggerID, "duration" : ( time.time() - startTime ) })
+        ####################################
+
+    # Loads statics and returns the execution plan along with the nodes the trigger starts from
+    def triggerHandlerPrepare(self,triggerID,data,actionIDType,flowIDType,debugSession):
         data["persistentData"]["system"]["conduct"] = self
 
         # Feature preload and cache so that we dont have to loop here?
@@ -72,28 +234,27 @@ class _conduct(jimi.db._document):
             for staticName, staticValue in self.statics.items():
                 data["flowData"]["var"]["statics"][staticName] = staticValue
 
-        flowDict = jimi.cache.globalCache.get("flowDict",self._id,getFlowDict,self.flow)
-        
-        uid = "{0}{1}".format(self._id,triggerID)
+        plan = self.getExecutionPlan()
         if actionIDType:
-            triggeredFlows = jimi.cache.globalCache.get("triggeredFlowActions",uid,getTriggeredFlowActions,self.flow,triggerID)
+            triggeredNodes = plan.actionNodes.get(triggerID,())
         elif flowIDType:
-            triggeredFlows = jimi.cache.globalCache.get("triggeredFlowFlows",uid,getTriggeredFlowFlows,self.flow,triggerID)
+            triggeredNodes = ( plan.nodes[triggerID], ) if triggerID in plan.nodes else ()
         else:
-            triggeredFlows = jimi.cache.globalCache.get("triggeredFlowTriggers",uid,getTriggeredFlowTriggers,self.flow,triggerID)
+            triggeredNodes = plan.triggerNodes.get(triggerID,())
 
-        for triggeredFlow in triggeredFlows:
-            self.flowHandler(triggeredFlow,flowDict,data,flowDebugSession=flowDebugSession)
+        # One memo is shared by every event of the run
+        if self.memoizeExpressions and not debugSession and "expressionMemo" not in data["persistentData"]["system"]:
+            data["persistentData"]["system"]["expressionMemo"] = jimi.helpers._expressionMemo()
+        return plan, triggeredNodes
 
-        ####################################
-        #              Footer              #
-        ####################################
-        if self.log:
-            jimi.audit._audit().add("conduct","trigger_end",{ "conduct_id" : self._id, "conduct_name" : self.name, "trigger_id" : triggerID, "duration" : ( time.time() - startTime ) })
-        ####################################
+    # Values memoised for the event are dropped once its flow has finished
+    def triggerHandlerFinish(self,data):
+        expressionMemo = data["persistentData"]["system"].get("expressionMemo")
+        if expressionMemo:
+            expressionMemo.clear(data["flowData"].get("event"))
 
     # Eval logic between links 
-    def flowLogicEval(self,data,logicVar):
+    def flowLogicEval(self,data,logicVar,compiledLogic=None):
         try:
             if type(logicVar) is bool:
                 try:
@@ -108,7 +269,10 @@ class _conduct(jimi.db._document):
                 except:
                     pass
             elif type(logicVar) is str:
-                if logicVar.startswith("if"):
+                if compiledLogic:
+                    if compiledLogic.evaluate({ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"]},jimi.function.systemFunctions):
+                        return True
+                elif logicVar.startswith("if"):
                     if jimi.logic.ifEval(logicVar, { "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"]}):
                         return True
                 elif logicVar == "*":
@@ -123,116 +287,260 @@ class _conduct(jimi.db._document):
             
         return False
 
-    def flowHandler(self,currentFlow,flowDict,data,flowDebugSession=None):
+    # Execution plan for the current revision of the conduct, codify flows carry their own objects so are planned per run
+    def getExecutionPlan(self):
+        if self.flow and "classObject" in self.flow[0]:
+            return _executionPlan(self)
+        return jimi.cache.globalCache.get("executionPlanCache","{0}:{1}".format(self._id,self.lastUpdateTime),getExecutionPlan,self)
+
+    def flowHandler(self,plan,currentNode,data,flowDebugSession=None,filterResult=None):
         if flowDebugSession or "flowDebugSession" in data["persistentData"]["system"]:
             if "flowDebugSession" in data["persistentData"]["system"]:
                 flowDebugSession = copy.deepcopy(data["persistentData"]["system"]["flowDebugSession"])
             else:
                 data["persistentData"]["system"]["flowDebugSession"] = flowDebugSession
             flowDebugSession["eventID"] = jimi.debug.flowDebugSession[flowDebugSession["sessionID"]].startEvent(data["flowData"]["trigger_name"],data["flowData"]["event"],data)
-        processQueue = []
         data["flowData"]["conductID"] = self._id
         data["flowData"]["action"] = { "result" : True, "rc" : 1337 }
-        flowObjectsUsed = []
-        codifyFlow = True if "classObject" in currentFlow else False
+        flowObjectsUsed = set()
+        self.flowBranchHandler(plan,currentNode,data,flowObjectsUsed,flowDebugSession,filterResult)
+        # Post processing for all event postRun actions, parallel branches have all been joined by this point
+        if data["flowData"]["eventStats"]["last"]:
+            for actionNode in plan.postRunNodes:
+                if actionNode.flowID in flowObjectsUsed:
+                    actionNode.object.postRun()
+
+        if flowDebugSession:
+            jimi.debug.flowDebugSession[flowDebugSession["sessionID"]].endEvent(flowDebugSession["eventID"])
+
+    # Walks the flow from currentNode, branches on parallel links are handed to the branch executor and joined before returning
+    def flowBranchHandler(self,plan,currentNode,data,flowObjectsUsed,flowDebugSession=None,filterResult=None):
+        processQueue = [(currentNode,data)]
+        parallelBranches = []
         cpuSaver = jimi.helpers.cpuSaver()
-        while True:
-            if currentFlow:
-                flowObjectsUsed.append(currentFlow["flowID"])
-                if currentFlow["type"] == "trigger":
-                    if not codifyFlow:
-                        currentTrigger = jimi.cache.globalCache.get("triggerCache",currentFlow["triggerID"]+currentFlow["flowID"],getTrigger,currentFlow)[0]
-                    else:
-                        currentTrigger = currentFlow["classObject"]
-                    # Logic and var defintion
-                    triggerContinue = True
-                    if currentTrigger.logicString:
-                        if jimi.logic.ifEval(currentTrigger.logicString,{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"]}):
-                            if currentTrigger.varDefinitions:
-                                data["flowData"]["var"] = jimi.variable.varEval(currentTrigger.varDefinitions,data["flowData"]["var"],{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"]},0)
-                                data["eventData"]["var"] = jimi.variable.varEval(currentTrigger.varDefinitions,data["eventData"]["var"],{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"]},1)
-                                data["conductData"]["var"] = jimi.variable.varEval(currentTrigger.varDefinitions,data["conductData"]["var"],{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"]},2)
-                                data["persistentData"]["var"] = jimi.variable.varEval(currentTrigger.varDefinitions,data["persistentData"]["var"],{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"]},3)
+        firstError = None
+        try:
+            while processQueue:
+                currentNode, data = processQueue.pop()
+                flowObjectsUsed.add(currentNode.flowID)
+                flowContinue = False
+                linkResults = None
+                if filterResult is not None:
+                    # Trigger and link logic of the first node were already decided by triggerBatchFilter
+                    flowContinue = filterResult is not False
+                    linkResults = filterResult
+                    filterResult = None
+                elif currentNode.type == "trigger":
+                    flowContinue = self.triggerFlowHandler(currentNode.flow,data,currentNode.codify,currentNode.object)
+                elif currentNode.type == "action":
+                    flowContinue = self.actionFlowHandler(currentNode.flow,data,currentNode.codify,flowDebugSession,currentNode.object)
+                if flowContinue:
+                    nextBranches = self.flowLinkHandler(currentNode,data,linkResults)
+                    # The last branch is always kept on this thread
+                    for index, nextBranch in enumerate(nextBranches):
+                        nextNode, passData, parallel = nextBranch
+                        if parallel and not flowDebugSession and index < len(nextBranches) - 1:
+                            branchArgs = (plan,nextNode,passData,flowObjectsUsed)
+                            parallelBranches.append((getBranchExecutor().submit(self.flowBranchHandler,*branchArgs),branchArgs))
                         else:
-                            triggerContinue = False
-                    else:
-                        if currentTrigger.varDefinitions:
-                            data["flowData"]["var"] = jimi.variable.varEval(currentTrigger.varDefinitions,data["flowData"]["var"],{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"]},0)
-                            data["eventData"]["var"] = jimi.variable.varEval(currentTrigger.varDefinitions,data["eventData"]["var"],{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"]},1)
-                            data["conductData"]["var"] = jimi.variable.varEval(currentTrigger.varDefinitions,data["conductData"]["var"],{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"]},2)
-                            data["persistentData"]["var"] = jimi.variable.varEval(currentTrigger.varDefinitions,data["persistentData"]["var"],{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"]},3)
-                    # If logic has said yes or no logic defined then move onto actions
-                    if triggerContinue == True:
-                        passData = data
-                        for nextFlow in currentFlow["next"]:
-                            if passData == None:
-                                passData = copyData(data)
-                            if self.flowLogicEval(data,nextFlow["logic"]):
-                                processQueue.append({ "flowID" : nextFlow["flowID"], "data" : passData })
-                            passData = None
-                elif currentFlow["type"] == "action":
-                    if not codifyFlow:
-                        class_ = jimi.cache.globalCache.get("actionCache",currentFlow["actionID"]+currentFlow["flowID"],getAction,currentFlow)[0]
-                    else:
-                        class_ = currentFlow["classObject"]
-                    if class_.enabled:
-                        data["flowData"]["flow_id"] = currentFlow["flowID"]
-                        debug = False
-                        if flowDebugSession:
-                            debug = True
-                            flowDebugSession["actionID"] = jimi.debug.flowDebugSession[flowDebugSession["sessionID"]].startAction(flowDebugSession["eventID"],data["flowData"]["flow_id"],class_.name,copyData(data,copyEventData=True,copyConductData=True,copyPersistentData=True))
-                        try:
-                            data["flowData"]["action"] = class_.runHandler(data=data,debug=debug)
-                        except Exception as e:
-                            jimi.logging.debug("Error: Action Crashed. actionID={0}, actionName={1}, error={2}".format(class_._id,class_.name,''.join(traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__))),-1)
-                            if flowDebugSession:
-                                raise
-                            if data["persistentData"]["system"]["trigger"].failOnActionFailure:
-                                # Force the trigger to be detected as failed due to startCheck + maxDuration time being less than now. jimi uses startCheck + maxDuration to understand the current status of a job.
-                                data["persistentData"]["system"]["trigger"].startCheck = 255
-                                data["persistentData"]["system"]["trigger"].update(["startCheck"])
-                                raise jimi.exceptions.actionCrash(class_._id,class_.name,e)
-                            if class_.systemCrashHandler:
-                                jimi.exceptions.actionCrash(class_._id,class_.name,e)
-                            data["flowData"]["action"] = { "result" : False, "rc" : -255, "error" : traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__) }
-                        data["flowData"]["action"]["action_id"] = class_._id
-                        data["flowData"]["action"]["action_name"] = class_.name
-                        if flowDebugSession:
-                            jimi.debug.flowDebugSession[flowDebugSession["sessionID"]].endAction(flowDebugSession["eventID"],flowDebugSession["actionID"],copyData(data,copyEventData=True,copyConductData=True,copyPersistentData=True))
-                        passData = data
-                        for nextFlow in currentFlow["next"]:
-                            if passData == None:
-                                passData = copyData(data)
-                            if self.flowLogicEval(data,nextFlow["logic"]):
-                                processQueue.append({ "flowID" : nextFlow["flowID"], "data" : passData })
-                            passData = None
-            if len(processQueue) == 0:
-                break
-            else:
-                nextFlowID = processQueue[-1]["flowID"]
-                data = processQueue[-1]["data"]
-                processQueue.pop()
+                            processQueue.append((nextNode,passData))
+                # CPU saver
+                cpuSaver.tick()
+        except BaseException as e:
+            firstError = e
+        # Branches that have not started yet are run on this thread so nested parallel branches can never exhaust the executor, after a failure they are dropped instead
+        for future, branchArgs in parallelBranches:
+            if future.cancel() and not firstError:
                 try:
-                    currentFlow = flowDict[nextFlowID]
-                except KeyError:
-                    currentFlow = None
+                    self.flowBranchHandler(*branchArgs)
+                except BaseException as e:
+                    firstError = e
+        # Started branches are always waited on so none is still running once the error is raised
+        startedBranches = [ future for future, branchArgs in parallelBranches if not future.cancelled() ]
+        concurrent.futures.wait(startedBranches)
+        for future in startedBranches:
+            if not firstError:
+                firstError = future.exception()
+        if firstError:
+            raise firstError
+
+    # Returns the next nodes whose link logic passed along with the data each should run with. Every link is decided before any branch starts as the first branch runs on the original data
+    def flowLinkHandler(self,currentNode,data,linkResults=None):
+        passData = data
+        nextBranches = []
+        for index, (nextNode, logicVar, compiledLogic, parallel) in enumerate(currentNode.next):
+            if passData == None:
+                passData = copyData(data)
+            if linkResults[index] if linkResults is not None else self.flowLogicEval(data,logicVar,compiledLogic):
+                nextBranches.append((nextNode,passData,parallel))
+            passData = None
+        return nextBranches
+
+    # Batched equivalent of flowHandler, events move through the flow together grouped per node so actions implementing runBatch are called once per node
+    def flowBatchHandler(self,plan,currentNode,dataBatch):
+        for data in dataBatch:
+            data["flowData"]["conductID"] = self._id
+            data["flowData"]["action"] = { "result" : True, "rc" : 1337 }
+        flowObjectsUsed = set()
+        processQueue = [(currentNode,dataBatch)]
+        cpuSaver = jimi.helpers.cpuSaver()
+        while processQueue:
+            currentNode, dataList = processQueue.pop()
+            flowObjectsUsed.add(currentNode.flowID)
+            if currentNode.type == "trigger":
+                dataList = [ data for data in dataList if self.triggerFlowHandler(currentNode.flow,data,currentNode.codify,currentNode.object) ]
+            elif currentNode.type == "action":
+                dataList = self.actionBatchFlowHandler(currentNode,dataList)
+            else:
+                dataList = []
+            nextBatches = {}
+            for data in dataList:
+                for nextNode, passData, parallel in self.flowLinkHandler(currentNode,data):
+                    if nextNode.flowID not in nextBatches:
+                        nextBatches[nextNode.flowID] = (nextNode,[])
+                    nextBatches[nextNode.flowID][1].append(passData)
+            processQueue += nextBatches.values()
             # CPU saver
             cpuSaver.tick()
         # Post processing for all event postRun actions
-        if data["flowData"]["eventStats"]["last"]:
-            for flow in flowDict:
-                if flowDict[flow]["type"] == "action" and flowDict[flow]["flowID"] in flowObjectsUsed:
-                    if not codifyFlow:
-                        class_ = jimi.cache.globalCache.get("actionCache",flowDict[flow]["actionID"]+flowDict[flow]["flowID"],getAction,flowDict[flow],dontCheck=True)
-                    else:
-                        class_ = [flowDict[flow]["classObject"]]
-                    if class_:
-                        if len(class_) > 0:
-                            class_ = class_[0]
-                            class_.postRun()
+        if any([ data["flowData"]["eventStats"]["last"] for data in dataBatch ]):
+            for actionNode in plan.postRunNodes:
+                if actionNode.flowID in flowObjectsUsed:
+                    actionNode.object.postRun()
+
+    # Runs the action once for every event reaching it, returns the events that should move onto the next flows
+    def actionBatchFlowHandler(self,currentNode,dataList):
+        class_ = currentNode.object
+        if not class_:
+            class_ = self.getFlowAction(currentNode.flow,currentNode.codify)
+        if not class_.enabled or not dataList:
+            return []
+        for data in dataList:
+            data["flowData"]["flow_id"] = currentNode.flowID
+        try:
+            actionResults = class_.runBatchHandler(dataList)
+        except Exception as e:
+            actionResults = [ self.actionCrashHandler(class_,data,e) for data in dataList ]
+        for data, actionResult in zip(dataList,actionResults):
+            data["flowData"]["action"] = actionResult
+            data["flowData"]["action"]["action_id"] = class_._id
+            data["flowData"]["action"]["action_name"] = class_.name
+        return dataList
+
+    # Coroutine equivalent of flowHandler for every triggered node, async actions are awaited and synchronous actions run on the event loop threads
+    async def flowHandlersAsync(self,plan,triggeredNodes,data):
+        for triggeredNode in triggeredNodes:
+            data["flowData"]["conductID"] = self._id
+            data["flowData"]["action"] = { "result" : True, "rc" : 1337 }
+            flowObjectsUsed = set()
+            await self.flowBranchHandlerAsync(plan,triggeredNode,data,flowObjectsUsed)
+            if data["flowData"]["eventStats"]["last"]:
+                for actionNode in plan.postRunNodes:
+                    if actionNode.flowID in flowObjectsUsed:
+                        await jimi.workers.runInThread(actionNode.object.postRun)
+
+    # Trigger logic, var definitions and link logic are evaluated on the event loop threads so only awaiting async actions happens on the loop itself
+    async def flowBranchHandlerAsync(self,plan,currentNode,data,flowObjectsUsed):
+        processQueue = [(currentNode,data)]
+        parallelBranches = []
+        firstError = None
+        try:
+            while processQueue:
+                currentNode, data = processQueue.pop()
+                flowObjectsUsed.add(currentNode.flowID)
+                flowContinue = False
+                if currentNode.type == "trigger":
+                    flowContinue = await jimi.workers.runInThread(self.triggerFlowHandler,currentNode.flow,data,currentNode.codify,currentNode.object)
+                elif currentNode.type == "action":
+                    flowContinue = await self.actionFlowHandlerAsync(currentNode.flow,data,currentNode.codify,currentNode.object)
+                if flowContinue:
+                    nextBranches = await jimi.workers.runInThread(self.flowLinkHandler,currentNode,data)
+                    for index, nextBranch in enumerate(nextBranches):
+                        nextNode, passData, parallel = nextBranch
+                        if parallel and index < len(nextBranches) - 1:
+                            parallelBranches.append(asyncio.ensure_future(self.flowBranchHandlerAsync(plan,nextNode,passData,flowObjectsUsed)))
+                        else:
+                            processQueue.append((nextNode,passData))
+        except BaseException as e:
+            firstError = e
+            for parallelBranch in parallelBranches:
+                parallelBranch.cancel()
+        # Branches are always waited on so none is still running once the error is raised
+        if parallelBranches:
+            for result in await asyncio.gather(*parallelBranches,return_exceptions=True):
+                if not firstError and isinstance(result,BaseException):
+                    firstError = result
+        if firstError:
+            raise firstError
 
+    # Trigger logic and var defintion, returns True when the flow should move onto the next flows
+    def triggerFlowHandler(self,currentFlow,data,codifyFlow=False,currentTrigger=None):
+        if not currentTrigger:
+            if not codifyFlow:
+                currentTrigger = jimi.cache.globalCache.get("triggerCache",currentFlow["triggerID"]+currentFlow["flowID"],getTrigger,currentFlow)[0]
+            else:
+                currentTrigger = currentFlow["classObject"]
+        if currentTrigger.logicString:
+            if not jimi.logic.ifEval(currentTrigger.logicString,{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"]}):
+                return False
+        if currentTrigger.varDefinitions:
+            jimi.variable.varEvalScopes(currentTrigger,data,{ "data" : data["flowData"], "eventData" : data["eventData"], "conductData" : data["conductData"], "persistentData" : data["persistentData"]})
+        return True
+
+    # Runs the action for the given flow, returns True when the flow should move onto the next flows
+    def actionFlowHandler(self,currentFlow,data,codifyFlow=False,flowDebugSession=None,class_=None):
+        if not class_:
+            class_ = self.getFlowAction(currentFlow,codifyFlow)
+        if not class_.enabled:
+            return False
+        data["flowData"]["flow_id"] = currentFlow["flowID"]
+        debug = False
         if flowDebugSession:
-            jimi.debug.flowDebugSession[flowDebugSession["sessionID"]].endEvent(flowDebugSession["eventID"])
+            debug = True
+            flowDebugSession["actionID"] = jimi.debug.flowDebugSession[flowDebugSession["sessionID"]].startAction(flowDebugSession["eventID"],data["flowData"]["flow_id"],class_.name,copyData(data,copyEventData=True,copyConductData=True,copyPersistentData=True))
+        try:
+            data["flowData"]["action"] = class_.runHandler(data=data,debug=debug)
+        except Exception as e:
+            if flowDebugSession:
+                jimi.logging.debug("Error: Action Crashed. actionID={0}, actionName={1}, error={2}".format(class_._id,class_.name,''.join(traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__))),-1)
+                raise
+            data["flowData"]["action"] = self.actionCrashHandler(class_,data,e)
+        data["flowData"]["action"]["action_id"] = class_._id
+        data["flowData"]["action"]["action_name"] = class_.name
+        if flowDebugSession:
+            jimi.debug.flowDebugSession[flowDebugSession["sessionID"]].endAction(flowDebugSession["eventID"],flowDebugSession["actionID"],copyData(data,copyEventData=True,copyConductData=True,copyPersistentData=True))
+        return True
+
+    async def actionFlowHandlerAsync(self,currentFlow,data,codifyFlow=False,class_=None):
+        if not class_:
+            class_ = await jimi.workers.runInThread(self.getFlowAction,currentFlow,codifyFlow)
+        if not class_.enabled:
+            return False
+        data["flowData"]["flow_id"] = currentFlow["flowID"]
+        try:
+            data["flowData"]["action"] = await class_.runHandlerAsync(data=data)
+        except Exception as e:
+            data["flowData"]["action"] = await jimi.workers.runInThread(self.actionCrashHandler,class_,data,e)
+        data["flowData"]["action"]["action_id"] = class_._id
+        data["flowData"]["action"]["action_name"] = class_.name
+        return True
+
+    def getFlowAction(self,currentFlow,codifyFlow=False):
+        if not codifyFlow:
+            return jimi.cache.globalCache.get("actionCache",currentFlow["actionID"]+currentFlow["flowID"],getAction,currentFlow)[0]
+        return currentFlow["classObject"]
+
+    # Raises when the trigger fails on action failure, otherwise returns the failed action result
+    def actionCrashHandler(self,class_,data,e):
+        jimi.logging.debug("Error: Action Crashed. actionID={0}, actionName={1}, error={2}".format(class_._id,class_.name,''.join(traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__))),-1)
+        if data["persistentData"]["system"]["trigger"].failOnActionFailure:
+            # Force the trigger to be detected as failed due to startCheck + maxDuration time being less than now. jimi uses startCheck + maxDuration to understand the current status of a job.
+            data["persistentData"]["system"]["trigger"].startCheck = 255
+            data["persistentData"]["system"]["trigger"].update(["startCheck"])
+            raise jimi.exceptions.actionCrash(class_._id,class_.name,e)
+        if class_.systemCrashHandler:
+            jimi.exceptions.actionCrash(class_._id,class_.name,e)
+        return { "result" : False, "rc" : -255, "error" : traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__) }
 
 def dataTemplate(data=None,keepEvent=False):
     if data != None and type(data) is dict:
@@ -289,17 +597,281 @@ def copyData(data,copyEventData=False,copyConductData=False,copyPersistentData=F
         copyOfData["eventData"] = data["eventData"]
     for dataType in dataTypes:
         copyOfData[dataType] = data[dataType].copy()
-        if not copyOfData[dataType]["var"]:
-            copyOfData[dataType]["var"] = {}
-        else:
-            copyOfData[dataType]["var"] = copy.deepcopy(data[dataType]["var"])
+        for copyOnWriteKey in ("var","plugin"):
+            if not copyOfData[dataType][copyOnWriteKey]:
+                copyOfData[dataType][copyOnWriteKey] = {}
+            else:
+                sourceDict = data[dataType][copyOnWriteKey]
+                # The source has to copy on write from now on as well, otherwise changes to it would show in the copy
+                if type(sourceDict) is not _copyOnWriteDict:
+                    sourceDict = _copyOnWriteDict(sourceDict)
+                    data[dataType][copyOnWriteKey] = sourceDict
+                copyOfData[dataType][copyOnWriteKey] = sourceDict.fork()
+
+    return copyOfData
+
+# Values that can be shared between copies without ever being copied
+immutableTypes = (str,int,float,bool,type(None),bytes)
+
+# Dict shared between data copies until written to. A fork borrows the mutable values of the dict it was forked from and takes its own copy of a value the first time it reads it, nested dicts are wrapped so only the path that is read is copied while other mutable values are deep copied. The dict lending a value keeps its own objects, before it hands a lent value out its borrowers are moved onto one deep copy of that value taken for all of them
+class _copyOnWriteDict(dict):
+    __slots__ = ("shared","lent","aliases","lender","borrowers","memo","lock","__weakref__")
+
+    def __init__(self,*args,**kwargs):
+        super(_copyOnWriteDict, self).__init__(*args,**kwargs)
+        # Keys whose value is borrowed so must never be changed through this dict
+        self.shared = set()
+        # Keys whose value belongs to this dict and is referenced by a fork
+        self.lent = set()
+        # Lent keys grouped by the objects their values have in common, worked out the first time a lent value is released
+        self.aliases = None
+        # Held so the dict this one borrows from can still reach the forks of this dict that borrow the same values
+        self.lender = None
+        self.borrowers = []
+        # Wrapped dicts and deep copies taken by this dict and its nested dicts, so objects referenced from several places stay a single object. Held in a list so a fork resets it for the nested dicts as well
+        self.memo = [{},{}]
+        # Each fork has its own lock shared only with its nested dicts
+        self.lock = threading.RLock()
+
+    # Returns a copy borrowing all mutable values from this dict
+    def fork(self):
+        forked = _copyOnWriteDict()
+        with self.lock:
+            dict.update(forked,dict.items(self))
+            forked.shared = set([ key for key, value in dict.items(self) if type(value) not in immutableTypes ])
+            if forked.shared:
+                forked.lender = self
+                self.lent.update(forked.shared - self.shared)
+                self.aliases = None
+                self.borrowers = [ borrower for borrower in self.borrowers if borrower() is not None ]
+                self.borrowers.append(weakref.ref(forked))
+                # Copies already handed out by this dict are now referenced by the fork
+                self.memo[0] = {}
+                self.memo[1] = {}
+        return forked
+
+    # Copy of a borrowed value, nested dicts are wrapped rather than copied
+    def copyValue(self,value):
+        if type(value) is dict or type(value) is _copyOnWriteDict:
+            memoValue = self.memo[0].get(id(value))
+            if memoValue and memoValue[0] is value:
+                return memoValue[1]
+            valueCopy = _copyOnWriteDict()
+            dict.update(valueCopy,dict.items(value))
+            valueCopy.shared = set([ key for key, nestedValue in dict.items(value) if type(nestedValue) not in immutableTypes ])
+            valueCopy.memo = self.memo
+            valueCopy.lock = self.lock
+            self.memo[0][id(value)] = (value,valueCopy)
+            return valueCopy
+        return copy.deepcopy(value,self.memo[1])
+
+    # Copy this dict has already taken of value, if any
+    def copyOf(self,value):
+        if type(value) is dict or type(value) is _copyOnWriteDict:
+            memoValue = self.memo[0].get(id(value))
+            if memoValue and memoValue[0] is value:
+                return memoValue[1]
+            return None
+        return self.memo[1].get(id(value))
+
+    def own(self,key):
+        if key in self.shared:
+            with self.lock:
+                if key in self.shared:
+                    dict.__setitem__(self,key,self.copyValue(dict.__getitem__(self,key)))
+                    self.shared.discard(key)
+        elif key in self.lent:
+            with self.lock:
+                if key in self.lent:
+                    self.release(key)
 
-        if not copyOfData[dataType]["plugin"]:
-            copyOfData[dataType]["plugin"] = {}
+    def ownAll(self):
+        for key in list(self.shared | self.lent):
+            self.own(key)
+
+    # Called before a lent value can be changed through this dict. Lent values sharing objects with it are released along with it so every borrower still sees them as one
+    def release(self,key):
+        if self.aliases is None:
+            self.aliases = aliasedKeys(self,self.lent)
+        keys = [ lentKey for lentKey in self.aliases.get(key,(key,)) if lentKey in self.lent ]
+        self.lent.difference_update(keys)
+        snapshot = _copyOnWriteSnapshot([ dict.__getitem__(self,lentKey) for lentKey in keys ])
+        for borrower in self.borrowers:
+            borrower = borrower()
+            if borrower is not None:
+                borrower.detach(snapshot)
+
+    # Moves every borrowed value the snapshot reaches onto its copy, through the nested dicts this dict has wrapped as well
+    def detach(self,snapshot):
+        with self.lock:
+            for borrower in self.borrowers:
+                borrower = borrower()
+                if borrower is not None:
+                    borrower.detach(snapshot)
+            # When this dict already holds copies of objects within the snapshot its nested dicts are wrapped rather than shared so the copies stay the objects they reference
+            keepCopies = snapshot.overlaps(self.memo)
+            for key, value in list(dict.items(self)):
+                if key in self.shared:
+                    if snapshot.reaches(value):
+                        valueCopy = self.copyOf(value)
+                        if valueCopy is None:
+                            if not keepCopies or ( type(value) is not dict and type(value) is not _copyOnWriteDict ):
+                                dict.__setitem__(self,key,snapshot.copyOf(value))
+                                continue
+                            valueCopy = self.copyValue(value)
+                    # A nested dict another dict wrapped can still hold values within the snapshot, it is wrapped again here so they can be moved
+                    elif type(value) is _copyOnWriteDict and snapshot.reachesWithin(value):
+                        valueCopy = self.copyValue(value)
+                    else:
+                        continue
+                    dict.__setitem__(self,key,valueCopy)
+                    self.shared.discard(key)
+                    value = valueCopy
+                if type(value) is _copyOnWriteDict:
+                    value.detach(snapshot)
+
+    def __getitem__(self,key):
+        self.own(key)
+        return dict.__getitem__(self,key)
+
+    def get(self,key,default=None):
+        self.own(key)
+        return dict.get(self,key,default)
+
+    # Called before a lent value is replaced. Its borrowers keep the value, unless it shares objects with other lent values that this dict could still change
+    def retire(self,key):
+        if self.aliases is None:
+            self.aliases = aliasedKeys(self,self.lent)
+        if key in self.aliases:
+            self.release(key)
         else:
-            copyOfData[dataType]["plugin"] = copy.deepcopy(data[dataType]["plugin"])
+            self.lent.discard(key)
 
-    return copyOfData
+    def __setitem__(self,key,value):
+        with self.lock:
+            self.shared.discard(key)
+            if key in self.lent:
+                self.retire(key)
+            dict.__setitem__(self,key,value)
+
+    def __delitem__(self,key):
+        with self.lock:
+            self.shared.discard(key)
+            if key in self.lent:
+                self.retire(key)
+            dict.__delitem__(self,key)
+
+    # Defined so dict(), {**} and dict.update go through keys() and __getitem__ rather than reading the raw values
+    def __iter__(self):
+        return dict.__iter__(self)
+
+    def pop(self,key,*args):
+        self.own(key)
+        with self.lock:
+            return dict.pop(self,key,*args)
+
+    def popitem(self):
+        self.ownAll()
+        with self.lock:
+            return dict.popitem(self)
+
+    def setdefault(self,key,default=None):
+        self.own(key)
+        with self.lock:
+            return dict.setdefault(self,key,default)
+
+    def update(self,*args,**kwargs):
+        for key, value in dict(*args,**kwargs).items():
+            self[key] = value
+
+    def clear(self):
+        with self.lock:
+            self.shared.clear()
+            for key in list(self.lent):
+                if key in self.lent:
+                    self.retire(key)
+            dict.clear(self)
+
+    def values(self):
+        self.ownAll()
+        return dict.values(self)
+
+    def items(self):
+        self.ownAll()
+        return dict.items(self)
+
+    def copy(self):
+        return self.fork()
+
+    def __copy__(self):
+        return self.fork()
+
+    def __deepcopy__(self,memo):
+        return copy.deepcopy(dict(dict.items(self)),memo)
+
+    def __reduce__(self):
+        return (dict, (dict(dict.items(self)),))
+
+# Deep copy of released values taken once for all of their borrowers, the copy memo maps every object within the values onto its copy
+class _copyOnWriteSnapshot():
+    __slots__ = ("values","memo")
+
+    def __init__(self,values):
+        self.values = values
+        self.memo = None
+
+    def reaches(self,value):
+        self.take()
+        return id(value) in self.memo
+
+    def copyOf(self,value):
+        self.take()
+        return self.memo[id(value)]
+
+    def reachesWithin(self,value):
+        for nestedValue in dict.values(value):
+            if self.reaches(nestedValue) or ( type(nestedValue) is _copyOnWriteDict and self.reachesWithin(nestedValue) ):
+                return True
+        return False
+
+    def overlaps(self,memo):
+        self.take()
+        return any([ objectID in self.memo for objectID in memo[0] ]) or any([ objectID in self.memo for objectID in memo[1] ])
+
+    def take(self):
+        if self.memo is None:
+            self.memo = {}
+            copy.deepcopy(self.values,self.memo)
+
+# Groups the given keys of a dict whose values reference any of the same objects, returns the group of every key within a group of more than one
+def aliasedKeys(dictValue,keys):
+    if len(keys) < 2:
+        return {}
+    groups = { key : key for key in keys }
+    def group(key):
+        while groups[key] != key:
+            key = groups[key]
+        return key
+    seen = {}
+    for key in keys:
+        stack = [dict.__getitem__(dictValue,key)]
+        while stack:
+            value = stack.pop()
+            if type(value) in immutableTypes:
+                continue
+            seenKey = seen.get(id(value))
+            if seenKey is not None:
+                groups[group(seenKey)] = group(key)
+                continue
+            seen[id(value)] = key
+            if isinstance(value,dict):
+                stack.extend(dict.values(value))
+            elif type(value) in (list,tuple,set,frozenset):
+                stack.extend(value)
+    aliases = {}
+    for key in keys:
+        aliases.setdefault(group(key),[]).append(key)
+    return { key : tuple(aliases[group(key)]) for key in keys if len(aliases[group(key)]) > 1 }
 
 def getAction(match,sessionData,currentflow):
     return jimi.action._action(False).getAsClass(id=currentflow["actionID"])
@@ -307,30 +879,86 @@ def getAction(match,sessionData,currentflow):
 def getTrigger(match,sessionData,currentflow):
     return jimi.trigger._trigger(False).getAsClass(id=currentflow["triggerID"])
 
-def getTriggeredFlowTriggers(uid,sessionData,flowData,triggerID):
-    return [ x for x in flowData if "triggerID" in x and x["triggerID"] == triggerID and x["type"] == "trigger" ]
-
-def getTriggeredFlowActions(uid,sessionData,flowData,actionID):
-    return [ x for x in flowData if "actionID" in x and x["actionID"] == actionID and x["type"] == "action" ]
-
-def getTriggeredFlowFlows(uid,sessionData,flowData,flowID):
-    # prevent cache when running as testTrigger
-    try:
-        classObject = flowData[0]["classObject"]
-        return (False, [ x for x in flowData if "flowID" in x and x["flowID"] == flowID ])
-    except:
-        return [ x for x in flowData if "flowID" in x and x["flowID"] == flowID ]
-
-def getFlowDict(uid,sessionData,flowData):
-    result = {}
-    for flow in flowData:
-        result[flow["flowID"]] = flow
-    # prevent cache when running as testTrigger
-    try:
-        classObject = flowData[0]["classObject"]
-        return (False, result)
-    except:
-        return result
+branchExecutor = None
+branchExecutorLock = threading.Lock()
+
+# Bounded executor shared by all conducts for parallel branches
+def getBranchExecutor():
+    global branchExecutor
+    if not branchExecutor:
+        with branchExecutorLock:
+            if not branchExecutor:
+                branchWorkers = jimi.settings.getSetting("conduct","branchWorkers")
+                if not branchWorkers:
+                    branchWorkers = 10
+                branchExecutor = ThreadPoolExecutor(max_workers=branchWorkers,thread_name_prefix="conductBranch")
+    return branchExecutor
+
+def getExecutionPlan(uid,sessionData,conduct):
+    return _executionPlan(conduct)
+
+class _executionPlanNode():
+    __slots__ = ("flowID","type","flow","object","codify","next")
+
+    def __init__(self,flow,codify):
+        self.flowID = flow["flowID"]
+        self.type = flow["type"]
+        self.flow = flow
+        self.codify = codify
+        self.object = None
+        self.next = ()
+
+# Immutable view of a conduct revision, built once so per event work is only graph traversal. Triggers and actions are resolved through the shared trigger and action caches and links hold their compiled logic
+class _executionPlan():
+    __slots__ = ("conductID","lastUpdateTime","codify","parallel","batch","nodes","triggerNodes","actionNodes","postRunNodes")
+
+    def __init__(self,conduct):
+        self.conductID = conduct._id
+        self.lastUpdateTime = conduct.lastUpdateTime
+        self.codify = bool(conduct.flow) and "classObject" in conduct.flow[0]
+        self.parallel = False
+        nodes = {}
+        triggerNodes = {}
+        actionNodes = {}
+        for flow in conduct.flow:
+            node = _executionPlanNode(flow,self.codify)
+            nodes[node.flowID] = node
+            if node.type == "trigger":
+                if self.codify:
+                    node.object = flow["classObject"]
+                else:
+                    currentTrigger = jimi.cache.globalCache.get("triggerCache",flow["triggerID"]+flow["flowID"],getTrigger,flow)
+                    if currentTrigger:
+                        node.object = currentTrigger[0]
+                triggerNodes.setdefault(flow["triggerID"],[]).append(node)
+            elif node.type == "action":
+                if self.codify:
+                    node.object = flow["classObject"]
+                else:
+                    currentAction = jimi.cache.globalCache.get("actionCache",flow["actionID"]+flow["flowID"],getAction,flow)
+                    if currentAction:
+                        node.object = currentAction[0]
+                actionNodes.setdefault(flow["actionID"],[]).append(node)
+        for node in nodes.values():
+            nextNodes = []
+            # Links to flows that no longer exist are dropped
+            for nextFlow in node.flow["next"]:
+                if nextFlow["flowID"] in nodes:
+                    logicVar = nextFlow["logic"]
+                    compiledLogic = None
+                    if type(logicVar) is str and logicVar[:3] == "if ":
+                        compiledLogic = jimi.logic.compileLogic(logicVar)
+                    # Branches run in parallel when enabled for the whole conduct or for the link
+                    parallel = bool(conduct.parallelBranches or nextFlow.get("parallel"))
+                    if parallel:
+                        self.parallel = True
+                    nextNodes.append((nodes[nextFlow["flowID"]],logicVar,compiledLogic,parallel))
+            node.next = tuple(nextNodes)
+        self.nodes = nodes
+        self.triggerNodes = { triggerID : tuple(value) for triggerID, value in triggerNodes.items() }
+        self.actionNodes = { actionID : tuple(value) for actionID, value in actionNodes.items() }
+        self.postRunNodes = tuple([ node for node in nodes.values() if node.type == "action" and node.object ])
+        self.batch = any([ node.object.hasBatch() for node in self.postRunNodes ])
 
 # API
 if jimi.api.webServer:
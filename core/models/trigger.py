@@ -1,5 +1,8 @@
 import time
 import copy
+import itertools
+import collections
+import collections.abc
 
 import jimi
 
@@ -10,6 +13,7 @@ class _trigger(jimi.db._document):
     lastCheck = float()
     nextCheck = int()
     startCheck = float()
+    queueCheck = float() # Refreshed by the scheduler while a scheduled check is waiting in the worker queue
     startTime = float() # Hidden runtime value that represents the actural startTime of notify 
     workerID = str()
     enabled = bool()
@@ -22,6 +26,8 @@ class _trigger(jimi.db._document):
     varDefinitions = dict()
     concurrency = 0  
     threaded = False
+    priority = 0 # Scheduled checks with a higher priority are always started first
+    weight = 1 # Share of worker starts compared to other triggers with the same priority
     failOnActionFailure = True
     attemptCount = int()
     autoRestartCount = 3
@@ -71,27 +77,37 @@ class _trigger(jimi.db._document):
         setattr(self,attr,value)
         return True
 
-    def notify(self,events=[],data=None):
+    # Inline calls i.e. subFlow only run the events through the conducts, no trigger state is written
+    def notify(self,events=[],data=None,inline=False):
         notifyStartTime = time.time()
-        self.startTime = notifyStartTime
+        # Inline calls share the cached trigger object so their start time is only kept in the flow data
+        if not inline:
+            self.startTime = notifyStartTime
 
         data = jimi.conduct.dataTemplate(data=data)
         data["persistentData"]["system"]["trigger"] = self
         data["flowData"]["trigger_id"] = self._id
         data["flowData"]["trigger_name"] = self.name
+        data["flowData"]["trigger_start_time"] = notifyStartTime
         tempData = data
 
         conducts = jimi.cache.globalCache.get("conductCache",self._id,getTriggerConducts)
         maxDuration = 60
         if self.maxDuration > 0:
             maxDuration = self.maxDuration
-        if conducts:
+        if conducts and type(events) is not list:
+            data = self.notifyStream(conducts,events,tempData,notifyStartTime,maxDuration)
+        elif conducts:
             cpuSaver = jimi.helpers.cpuSaver()
             for loadedConduct in conducts:
                 eventHandler = None
                 if self.concurrency > 0:
-                    eventHandler = jimi.workers.workerHandler(self.concurrency)
+                    eventHandler = jimi.workers.concurrentGroup(self.concurrency)
                     concurrentEvents = []
+                # Async and batch conducts take every event as one batch so that they are all in flight together
+                batchEvents = None
+                if not eventHandler and ( loadedConduct.asyncFlow or loadedConduct.getExecutionPlan().batch ):
+                    batchEvents = []
 
                 dataCopy = jimi.conduct.copyData(tempData,copyConductData=True)
                 dataCopy["flowData"]["conduct_id"] = loadedConduct._id
@@ -109,27 +125,32 @@ class _trigger(jimi.db._document):
 
                     if eventHandler:
                         concurrentEvents.append(data)
+                    elif batchEvents is not None:
+                        batchEvents.append(data)
                     else:
                         loadedConduct.triggerHandler(self._id,data,False,False)
 
                     # CPU saver
                     cpuSaver.tick()
 
+                if batchEvents:
+                    loadedConduct.triggerBatchHandler(self._id,batchEvents,False,False)
+
                 # Waiting for all jobs to complete
                 if eventHandler:
                     eventBatches = jimi.helpers.splitList(concurrentEvents,int(len(concurrentEvents)/self.concurrency))
                     for events in eventBatches:
-                        durationRemaining = ( self.startTime + maxDuration ) - time.time()
-                        eventHandler.new("trigger:{0}".format(self._id),loadedConduct.triggerBatchHandler,(self._id,events,False,False),maxDuration=durationRemaining)
-                    eventHandler.waitAll()
-                    if eventHandler.failures or eventHandler.failureCount() > 0:
-                        raise jimi.exceptions.triggerConcurrentCrash(self._id,self.name,eventHandler.failures)
-                    eventHandler.stop()
-        else:
+                        eventHandler.new(loadedConduct.triggerBatchHandler,(self._id,events,False,False))
+                    if not eventHandler.waitAll(( notifyStartTime + maxDuration ) - time.time()):
+                        raise jimi.exceptions.triggerConcurrentCrash(self._id,self.name,eventHandler.exceptions)
+        elif not inline:
             jimi.audit._audit().add("trigger","auto_disable",{ "trigger_id" : self._id, "trigger_name" : self.name })
             self.enabled = False
             self.update(["enabled"])
 
+        if inline:
+            return data
+
         self.startCheck = 0
         self.attemptCount = 0
         self.lastCheck = time.time()
@@ -139,7 +160,72 @@ class _trigger(jimi.db._document):
         # Return the final data value
         return data
 
-    def checkHandler(self):
+    # Streams events from an iterator into every conduct without holding the full event list. Events are grouped into chunks and no more events are pulled while the window of chunks in flight is full
+    def notifyStream(self,conducts,events,tempData,notifyStartTime,maxDuration):
+        chunkSize = jimi.settings.getSetting("trigger","streamChunkSize")
+        if not chunkSize:
+            chunkSize = 100
+        conductStreams = []
+        for loadedConduct in conducts:
+            dataCopy = jimi.conduct.copyData(tempData,copyConductData=True)
+            dataCopy["flowData"]["conduct_id"] = loadedConduct._id
+            dataCopy["flowData"]["conduct_name"] = loadedConduct.name
+            eventHandler = None
+            if self.concurrency > 0:
+                eventHandler = jimi.workers.concurrentGroup(self.concurrency)
+            batched = not eventHandler and ( loadedConduct.asyncFlow or loadedConduct.getExecutionPlan().batch )
+            conductStreams.append({ "conduct" : loadedConduct, "data" : dataCopy, "eventHandler" : eventHandler, "batched" : batched, "chunk" : [] })
+
+        data = tempData
+        cpuSaver = jimi.helpers.cpuSaver()
+        # Stats of every event that can still be waiting or running, backpressure keeps at most two chunks per concurrent worker in flight plus the chunk being built
+        pendingEventStats = collections.deque(maxlen=chunkSize * ( max(self.concurrency,0) * 2 + 1 ))
+        events = iter(events)
+        nextEvent = next(events,streamEnd)
+        index = 0
+        while nextEvent is not streamEnd:
+            event = nextEvent
+            # One event look ahead so the last event is known, the total is unknown until the stream ends
+            nextEvent = next(events,streamEnd)
+            last = nextEvent is streamEnd
+            eventStats = { "first" : index == 0, "current" : index, "total" : None, "last" : last }
+            pendingEventStats.append(eventStats)
+            if last:
+                for pendingStats in pendingEventStats:
+                    pendingStats["total"] = index + 1
+            for conductStream in conductStreams:
+                data = jimi.conduct.copyData(conductStream["data"],copyEventData=True)
+                data["flowData"]["event"] = event
+                data["flowData"]["eventStats"] = eventStats
+                if conductStream["eventHandler"] or conductStream["batched"]:
+                    conductStream["chunk"].append(data)
+                    if len(conductStream["chunk"]) >= chunkSize or last:
+                        self.notifyStreamChunk(conductStream)
+                else:
+                    conductStream["conduct"].triggerHandler(self._id,data,False,False)
+            index += 1
+            # CPU saver
+            cpuSaver.tick()
+
+        # Waiting for all jobs to complete
+        for conductStream in conductStreams:
+            eventHandler = conductStream["eventHandler"]
+            if eventHandler and not eventHandler.waitAll(( notifyStartTime + maxDuration ) - time.time()):
+                raise jimi.exceptions.triggerConcurrentCrash(self._id,self.name,eventHandler.exceptions)
+        return data
+
+    def notifyStreamChunk(self,conductStream):
+        eventHandler = conductStream["eventHandler"]
+        if eventHandler:
+            # Backpressure, at most two chunks per concurrent worker are queued or running at once
+            eventHandler.waitIncomplete(self.concurrency * 2)
+            eventHandler.new(conductStream["conduct"].triggerBatchHandler,(self._id,conductStream["chunk"],False,False))
+        else:
+            conductStream["conduct"].triggerBatchHandler(self._id,conductStream["chunk"],False,False)
+        conductStream["chunk"] = []
+
+    # Scheduled checks are queued before they start so startCheck is only set once the check is running
+    def checkHandler(self,stream=True,scheduled=False):
         ####################################
         #              Header              #
         ####################################
@@ -147,8 +233,13 @@ class _trigger(jimi.db._document):
         jimi.audit._audit().add("trigger","start",{ "trigger_id" : self._id, "trigger_name" : self.name })
         ####################################
 
+        if scheduled:
+            self.startCheck = startTime
+            self.queueCheck = 0
+            self.update(["startCheck","queueCheck"])
+
         self.data = { "flowData" : { "var" : {}, "plugin" : {} } }
-        events = self.doCheck()
+        events = self.doCheck(stream=stream)
         data = None
         if self.data["flowData"]["var"] or self.data["flowData"]["plugin"]:
             data = self.data
@@ -160,14 +251,25 @@ class _trigger(jimi.db._document):
         jimi.audit._audit().add("trigger","end",{ "trigger_id" : self._id, "trigger_name" : self.name, "duration" : ( time.time() - startTime ) })
         ####################################
 
-    def doCheck(self):
+    # stream=True returns events yielded by check as an iterator instead of a list
+    def doCheck(self,stream=False):
         self.result = { "events" : [], "var" : {}, "plugin" : {} }
-        self.check()
+        checkEvents = self.check()
+        # Only generators and other iterators are streamed, any other return value from check is ignored as before
+        if isinstance(checkEvents,collections.abc.Iterator):
+            # Pulling the first event runs check up to its first yield so var and plugin values set beforehand are included in the flow data
+            firstEvent = next(checkEvents,streamEnd)
+            if firstEvent is not streamEnd:
+                checkEvents = itertools.chain(self.result["events"],[firstEvent],checkEvents)
+                if stream:
+                    self.result["events"] = checkEvents
+                else:
+                    self.result["events"] = list(checkEvents)
         self.data["flowData"]["var"] = self.result["var"]
         self.data["flowData"]["plugin"] = self.result["plugin"]
         return self.result["events"]
 
-    # Main function called to determine if a trigger is triggered
+    # Main function called to determine if a trigger is triggered, events can be appended to result events or yielded for large result sets
     def check(self):
         self.result["events"].append({ "tick" : True })
 
@@ -184,6 +286,9 @@ class _trigger(jimi.db._document):
         return usedIn
 
 
+# Marks the end of a streamed event iterator
+streamEnd = object()
+
 def getClassObject(classID,sessionData):
     return jimi.model._model().getAsClass(id=classID)
 
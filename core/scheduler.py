@@ -24,26 +24,32 @@ class _scheduler:
         while not self.stopped:
             now = int(time.time())
             self.lastHandle = now
+            # Scheduled checks still waiting in the worker queue are not yet started, refreshing queueCheck stops the cluster treating them as failed
+            queuedTriggerIDs = scheduledTriggerIDs(jimi.workers.workers.queuedKeys())
+            pendingTriggerIDs = scheduledTriggerIDs(jimi.workers.workers.pendingKeys())
+            if queuedTriggerIDs:
+                jimi.trigger._trigger()._dbCollection.update_many({ "_id" : { "$in" : [ jimi.db.ObjectId(triggerID) for triggerID in queuedTriggerIDs ] } },{ "$set" : { "queueCheck" : now } })
             for t in jimi.trigger._trigger(False).getAsClass(query={ "systemID" : self.systemId, "systemIndex" : self.systemIndex, "$or" : [ {"nextCheck" : { "$lt" :  now}}, {"$or" : [ {"nextCheck" : { "$eq" : ""}} , {"nextCheck" : {"$eq" : None }} ] } ], "enabled" : True, "startCheck" :  0, "$and":[{"schedule" : {"$ne" : None}} , {"schedule" : {"$ne" : ""}} ] }):
                 if t.nextCheck == 0:
                     t.nextCheck = getSchedule(t.schedule)
                     t.update(["nextCheck"])
-                else:
-                    if jimi.workers.workers.activeCount() < jimi.workers.workers.concurrent:
-                        t.startCheck = time.time()
-                        t.attemptCount += 1
-                        t.executionCount += 1
-                        maxDuration = 60
-                        if type(t.maxDuration) is int and t.maxDuration > 0:
-                            maxDuration = t.maxDuration
-                        t.workerID = jimi.workers.workers.new("trigger:'{0}','{1}'".format(t._id,t.name),t.checkHandler,(),maxDuration=maxDuration,multiprocessing=t.threaded)
-                        t.update(["startCheck","workerID","attemptCount","executionCount"])      
-                    else:
-                        if jimi.logging.debugEnabled:
-                            jimi.logging.debug("Scheduler trigger start cannot requested, as the max conncurrent workers are already active. Will try again shortly",3)
+                elif t._id not in pendingTriggerIDs:
+                    # Always queued, the worker queue decides the start order by priority and weight. checkHandler sets startCheck once the check starts
+                    t.queueCheck = now
+                    t.attemptCount += 1
+                    t.executionCount += 1
+                    maxDuration = 60
+                    if type(t.maxDuration) is int and t.maxDuration > 0:
+                        maxDuration = t.maxDuration
+                    t.workerID = jimi.workers.workers.new("trigger:'{0}','{1}'".format(t._id,t.name),t.checkHandler,(True,True),maxDuration=maxDuration,multiprocessing=t.threaded,priority=t.priority,weight=t.weight,queueKey=("scheduler",t._id))
+                    t.update(["queueCheck","workerID","attemptCount","executionCount"])      
             # pause
             time.sleep(jimi.settings.getSetting("scheduler","loopP"))
 
+# Trigger IDs from the queueKeys of scheduled checks, other workers share the same queue under their own keys
+def scheduledTriggerIDs(queueKeys):
+    return set([ queueKey[1] for queueKey in queueKeys if type(queueKey) is tuple and queueKey[0] == "scheduler" ])
+
 # Get next run time from schedule string
 def getSchedule(scheduleString):
     if scheduleString:
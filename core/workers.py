@@ -2,9 +2,15 @@ from multiprocessing import Process, Queue
 import multiprocessing
 from re import L
 import threading
+import atexit
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import collections
+import heapq
 import time
 import uuid
 import ctypes
+import pickle
 import traceback
 import json
 import logging
@@ -33,13 +39,132 @@ class _threading(threading.Thread):
         if res > 1: 
             ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_long(thread_id), 0)
 
+# Waiting workers grouped by priority and then by queueKey. The highest priority with waiting workers is always served first, within it queueKeys are served by stride scheduling so each gets starts in proportion to its weight and a large backlog on one key cannot starve the others
+class _workerQueue():
+    def __init__(self):
+        self.priorities = {}
+        self.count = 0
+        self.stats = {}
+
+    def __len__(self):
+        return self.count
+
+    def append(self, worker):
+        try:
+            priorityQueue = self.priorities[worker.priority]
+        except KeyError:
+            priorityQueue = _priorityQueue()
+            self.priorities[worker.priority] = priorityQueue
+        priorityQueue.append(worker)
+        self.count += 1
+
+    def popleft(self):
+        if not self.count:
+            raise IndexError("pop from an empty queue")
+        priority = max([ priority for priority, priorityQueue in self.priorities.items() if priorityQueue.count ])
+        self.count -= 1
+        return self.priorities[priority].popleft()
+
+    def recordWait(self, worker):
+        waitTime = time.time() - worker.queuedTime
+        try:
+            stats = self.stats[worker.priority]
+        except KeyError:
+            stats = { "started" : 0, "totalWait" : 0, "maxWait" : 0 }
+            self.stats[worker.priority] = stats
+        stats["started"] += 1
+        stats["totalWait"] += waitTime
+        if waitTime > stats["maxWait"]:
+            stats["maxWait"] = waitTime
+
+    def getStats(self):
+        result = {}
+        for priority, stats in self.stats.items():
+            result[priority] = { "started" : stats["started"], "waiting" : self.priorities[priority].count, "averageWait" : stats["totalWait"] / stats["started"], "maxWait" : stats["maxWait"] }
+        return result
+
+    # queueKeys with at least one waiting worker
+    def queuedKeys(self):
+        return set([ queueKey for priorityQueue in self.priorities.values() for queueKey, keyQueue in priorityQueue.keys.items() if keyQueue[0] ])
+
+class _priorityQueue():
+    def __init__(self):
+        self.keys = {}
+        # ( pass, sequence, queueKey ) for every queueKey with waiting workers
+        self.heap = []
+        self.sequence = 0
+        self.virtualTime = 0
+        self.count = 0
+
+    def append(self, worker):
+        try:
+            keyQueue = self.keys[worker.queueKey]
+        except KeyError:
+            keyQueue = [collections.deque(),0]
+            self.keys[worker.queueKey] = keyQueue
+        if not keyQueue[0]:
+            # Idle keys rejoin at the current virtual time so they do not bank credit while idle
+            keyQueue[1] = max(keyQueue[1],self.virtualTime)
+            self.pushKey(worker.queueKey,keyQueue[1])
+        keyQueue[0].append(worker)
+        self.count += 1
+
+    def popleft(self):
+        keyPass, sequence, queueKey = heapq.heappop(self.heap)
+        keyQueue = self.keys[queueKey]
+        worker = keyQueue[0].popleft()
+        self.count -= 1
+        self.virtualTime = keyPass
+        keyQueue[1] = keyPass + ( 1 / worker.weight )
+        if keyQueue[0]:
+            self.pushKey(queueKey,keyQueue[1])
+        elif not self.count:
+            # Idle keys are only remembered while other keys are waiting, an empty queue starts over
+            self.keys = {}
+            self.virtualTime = 0
+        return worker
+
+    def pushKey(self, queueKey, keyPass):
+        self.sequence += 1
+        heapq.heappush(self.heap,(keyPass,self.sequence,queueKey))
+
+# Long lived workerHandler thread running one worker after another
+class _poolThread(_threading):
+    def __init__(self, *args, **keywords):
+        _threading.__init__(self, *args, **keywords)
+        self.currentWorker = None
+        # Held while a worker is handed to or taken off the thread and while it is killed, so a kill only ever reaches the worker it was meant for
+        self.killLock = threading.Lock()
+
+    def startWorker(self, worker):
+        with self.killLock:
+            self.currentWorker = worker
+
+    # Also drops a kill raised for the worker that the thread has not received yet
+    def releaseWorker(self):
+        with self.killLock:
+            self.currentWorker = None
+            ctypes.pythonapi.PyThreadState_SetAsyncExc(ctypes.c_long(self.ident), None)
+
+    def killWorker(self, worker):
+        with self.killLock:
+            if self.currentWorker is worker and worker.running == True:
+                self.kill()
+
 class workerHandler:
     class _worker:
-        def __init__(self, name, call, args, delete, maxDuration, multiprocessing, raiseException, debugSession):
+        __slots__ = ("name","call","id","createdTime","startTime","endTime","duration","result","resultException","raiseException","debugSession","running","crash","args","multiprocessing","thread","maxDuration","delete","onComplete","priority","weight","queueKey","queuedTime")
+
+        def __init__(self, name, call, args, delete, maxDuration, multiprocessing, raiseException, debugSession, priority=0, weight=1, queueKey=None):
             self.name = name
             self.call = call
             self.id = str(uuid.uuid4())
             self.createdTime = int(time.time())
+            self.queuedTime = time.time()
+            # Higher priority workers always start first, within a priority each queueKey gets a share of starts in proportion to its weight
+            self.priority = priority
+            self.weight = weight if weight > 0 else 1
+            self.queueKey = queueKey if queueKey != None else name
             self.startTime = 0
             self.endTime = 0
             self.duration = 0
@@ -51,32 +176,62 @@ class workerHandler:
             self.crash = False
             self.args = args
             self.multiprocessing = multiprocessing
-            if not self.multiprocessing:
-                self.thread = _threading(target=self.threadCall)
-            else:
-                self.thread = _threading(target=self.multiprocessingThreadCall)
+            # Set to the pool thread running the worker once started
+            self.thread = None
             self.maxDuration = maxDuration
             self.delete = delete
+            # Called with the worker once it has finished, including when killed
+            self.onComplete = None
 
+        # Runs the worker on its own thread, workerHandler jobs are run by its pool threads instead
         def start(self):
+            self.thread = _threading(target=self.run)
             self.thread.start()
 
+        def kill(self):
+            thread = self.thread
+            # Pool threads move onto other workers so only kill the thread while it is still running this one
+            if type(thread) is _poolThread:
+                thread.killWorker(self)
+            elif thread and self.running == True:
+                thread.kill()
+
+        def run(self):
+            try:
+                self.execute()
+            finally:
+                if self.onComplete:
+                    self.onComplete(self)
+
+        def execute(self):
+            if not self.multiprocessing:
+                self.threadCall()
+            else:
+                self.multiprocessingThreadCall()
+
         def multiprocessingThreadCall(self):
             self.startTime = int(time.time())
             self.running = True
             if jimi.logging.debugEnabled:
                 jimi.logging.debug("Threaded process worker started, workerID={0}".format(self.id))
 
-            Q = Queue()
-            p = Process(target=multiprocessingThreadStart, args=(Q,self.call,self.args))
+            pool = getProcessPool()
+            child = None
             try:
-                p.start()
+                # Pickled here so that unpicklable calls fail the worker straight away rather than within the queue feeder thread
+                task = pickle.dumps((getCallReference(self.call),self.args or ()))
+                child = pool.acquire()
+                child.taskQueue.put(task)
                 try:
-                    rc, e = Q.get(timeout=self.maxDuration)
-                    p.join(timeout=0)
-                    p.terminate()
+                    rc, e, recycle = child.resultQueue.get(timeout=self.maxDuration)
                 except:
                     raise SystemExit
+                # Only a child that finished its task cleanly goes back into the pool
+                if not recycle:
+                    pool.release(child)
+                else:
+                    pool.discard(child)
+                child = None
 
                 if rc != 0:
                     self.crash = True
@@ -99,9 +254,9 @@ class workerHandler:
                     self.crash = True
                     jimi.exceptions.workerCrash(self.id,self.name,''.join(traceback.format_exception(etype=type(e), value=e, tb=e.__traceback__)))
             finally:
-                if p.exitcode == None:
-                    p.terminate()
-                Q.close()
+                # Killed or overrun, the child may still be running the task
+                if child:
+                    pool.discard(child,terminate=True)
             
             if jimi.logging.debugEnabled:
                 jimi.logging.debug("Threaded process worker completed, workerID={0}".format(self.id))
@@ -144,142 +299,187 @@ class workerHandler:
 
     def __init__(self,concurrent=15,autoStart=True,cleanUp=True):
         self.concurrent = concurrent
-        self.workerList = []
         self.stopped = False
         self.cleanUp = cleanUp
         self.backlog = False
         self.failures = False
+        # new() queues and signals, an idle pool thread takes the worker and completions signal any waiters
+        self.condition = threading.Condition()
+        # Queued and running workers by id, finished workers move into a fixed size history
+        self.workers = {}
+        self.workersWaiting = _workerQueue()
+        self.workersRunning = {}
+        historySize = None
+        if cleanUp:
+            historySize = 1000
+            if workerSettings and workerSettings.get("history"):
+                historySize = workerSettings["history"]
+        self.workersFinished = collections.deque(maxlen=historySize)
+        self.workersFinishedIndex = {}
+        self.crashCount = 0
+        self.poolThreads = []
+        self.poolGeneration = 0
+        self.workerID = None
+        self.lastHandle = int(time.time())
         
         # Autostarting worker handler thread
         if autoStart:
             self.start()
     
     def start(self):
-        self.stopped = False
+        with self.condition:
+            self.stopped = False
+            # Pool threads from before a restart exit once their current worker completes
+            self.poolGeneration += 1
+            self.poolThreads = []
+            for index in range(self.concurrent):
+                poolThread = _poolThread(target=self.poolHandler,args=(self.poolGeneration,),name="workerPool-{0}".format(index),daemon=True)
+                self.poolThreads.append(poolThread)
+        for poolThread in self.poolThreads:
+            poolThread.start()
         workerThread = self._worker("workerThread",self.handler,None,True,0,False,True,None)
+        workerThread.onComplete = self.workerComplete
+        with self.condition:
+            self.workers[workerThread.id] = workerThread
         workerThread.start()
-        self.workerList.append(workerThread)
         self.workerID = workerThread.id
 
     def stop(self):
-        self.stopped = True
-        # Waiting 1 second for handler to finish gracefully otherwise force by systemExit
-        time.sleep(1)
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        # Waiting up to 1 second for handler to finish gracefully otherwise force by systemExit
+        handlerWorker = self.get(self.workerID)
+        if handlerWorker and handlerWorker.thread is not threading.current_thread():
+            handlerWorker.thread.join(1)
         for runningJob in self.getActive():
             self.kill(runningJob.id)
         for job in self.getAll():
             self.delete(job.id)
+        stopProcessPool()
 
     def handler(self):
         tick = 0
-        loops = 0
-        underConcurrent = self.concurrent # Used to limit list looping to find active workers
-        workersStillWaiting = [] # Cache waiting workers to limit list looping to find waiting workers
         while not self.stopped:
             now = int(time.time())
             self.lastHandle = now
 
-            # Any room to start another worker?
-            if underConcurrent < 1:
-                activeWorkerCount = self.activeCount()
-                underConcurrent = ( self.concurrent - activeWorkerCount )
-            if underConcurrent > 0:
-                if len(workersStillWaiting) == 0:
-                    workersStillWaiting = [ x for x in self.workerList if x.running == None ]
-                if len(workersStillWaiting) > 0:
-                    self.backlog = True
-                    # Check if number of workersWaiting is above the number of available concurrent threads and select mx available
-                    workersWaiting = workersStillWaiting
-                    if len(workersWaiting) > underConcurrent:
-                        workersWaiting = workersWaiting[0:underConcurrent]
-                    # Start all workers possible up to the concurrent limit
-                    for workerWaiting in workersWaiting:
-                        if jimi.logging.debugEnabled:
-                            jimi.logging.debug("Starting threaded worker, workerID={0}".format(workerWaiting.id))
-                        workerWaiting.start()
-                        underConcurrent-=1
-                        del workersStillWaiting[workersStillWaiting.index(workerWaiting)]
-                else:
-                    self.backlog = False
-            else:
-                self.backlog = False
+            self.backlog = len(self.workersWaiting) > 0
 
-            # Execute worker cleanup every 5ish seconds
+            # Kill workers that have overrun every 5ish seconds, finished workers are moved into the history as they complete
             if (tick + 5) < now:
-                # Any workers need cleaning up due to overrun or stopped?
-                cleanupWorkers = [ x for x in self.workerList if (x.running == False and x.delete) or (x.startTime > 0 and x.maxDuration > 0 and (now - x.startTime ) > x.maxDuration) ]
-                for worker in cleanupWorkers:
-                    if worker.running != False:
-                        worker.thread.kill()
-                    if not self.failures and worker.resultException != None and worker.endTime != 0:
-                        self.failures = True
-                    if self.cleanUp:
-                        if worker.endTime != 0 or (( worker.endTime + 60 < now ) and worker.endTime != 0):
-                            self.workerList.remove(worker)
+                with self.condition:
+                    overrunWorkers = [ x for x in self.workersRunning.values() if x.startTime > 0 and x.maxDuration > 0 and (now - x.startTime ) > x.maxDuration ]
+                for worker in overrunWorkers:
+                    worker.kill()
                 tick = now
 
-            # CPU saver
-            loops+=1
-            if ((underConcurrent == 0) or (underConcurrent > 0 and len(workersStillWaiting) == 0)):
-                loops = 0
-                time.sleep(workerSettings["loopT1"])
-            elif (loops > workerSettings["loopL"]):
-                loops = 0
-                time.sleep(workerSettings["loopT"])
+            # Queued workers are started by the pool threads, the handler only wakes for the cleanup and lastHandle heartbeat
+            with self.condition:
+                if not self.stopped:
+                    self.condition.wait(max(( tick + 6 ) - time.time(),0.1))
+
+    # Pool threads take the next queued worker, there are concurrent pool threads so at most concurrent workers run at once
+    def poolHandler(self,poolGeneration):
+        poolThread = threading.current_thread()
+        while True:
+            worker = None
+            try:
+                try:
+                    with self.condition:
+                        while not self.workersWaiting and not self.stopped and poolGeneration == self.poolGeneration:
+                            self.condition.wait()
+                        if self.stopped or poolGeneration != self.poolGeneration:
+                            return
+                        worker = self.workersWaiting.popleft()
+                        self.workersWaiting.recordWait(worker)
+                        self.workersRunning[worker.id] = worker
+                        worker.thread = poolThread
+                        poolThread.startWorker(worker)
+                    if jimi.logging.debugEnabled:
+                        jimi.logging.debug("Starting threaded worker, workerID={0}".format(worker.id))
+                    worker.execute()
+                finally:
+                    if worker:
+                        # Once released no kill can reach the thread, so recording the worker as finished cannot be interrupted
+                        worker.running = False
+                        while poolThread.currentWorker is worker:
+                            try:
+                                poolThread.releaseWorker()
+                            except SystemExit:
+                                pass
+                        if worker.onComplete:
+                            worker.onComplete(worker)
+            except SystemExit:
+                # A kill arriving after its worker already finished, the thread carries on with the next worker
+                pass
+            except Exception as e:
+                jimi.logging.debug("Error: Worker pool thread caught an unhandled worker exception. error={0}".format(e),-1)
+
+    def workerComplete(self,worker):
+        with self.condition:
+            self.workersRunning.pop(worker.id,None)
+            self.workers.pop(worker.id,None)
+            if worker.crash:
+                self.crashCount += 1
+            if worker.resultException != None:
+                self.failures = True
+            if self.workersFinished.maxlen and len(self.workersFinished) == self.workersFinished.maxlen:
+                self.workersFinishedIndex.pop(self.workersFinished[0].id,None)
+            self.workersFinished.append(worker)
+            self.workersFinishedIndex[worker.id] = worker
+            self.condition.notify_all()
             
-    def new(self, name, call, args=None, delete=True, maxDuration=60, multiprocessing=False, raiseException=True, debugSession=None):
-        workerThread = self._worker(name, call, args, delete, maxDuration, multiprocessing, raiseException, debugSession)
-        self.workerList.append(workerThread)
+    def new(self, name, call, args=None, delete=True, maxDuration=60, multiprocessing=False, raiseException=True, debugSession=None, priority=0, weight=1, queueKey=None):
+        workerThread = self._worker(name, call, args, delete, maxDuration, multiprocessing, raiseException, debugSession, priority, weight, queueKey)
+        workerThread.onComplete = self.workerComplete
+        with self.condition:
+            self.workers[workerThread.id] = workerThread
+            self.workersWaiting.append(workerThread)
+            self.condition.notify_all()
         if jimi.logging.debugEnabled:
             jimi.logging.debug("Created new worker, workerID={0}".format(workerThread.id))
         return workerThread.id
 
     def get(self, id):
-        worker = [x for x in self.workerList if x.id == id]
-        if worker:
-            worker = worker[0]
+        worker = self.workers.get(id) or self.workersFinishedIndex.get(id)
         if jimi.logging.debugEnabled:
             jimi.logging.debug("Got data for worker, workerID={0}".format(id))
         return worker
 
     def getAll(self):
-        result = []
-        for worker in self.workerList:
-            result.append(worker)
-        return result
+        with self.condition:
+            return list(self.workers.values()) + list(self.workersFinished)
 
     def getActive(self):
-        result = []
-        workersRunning = [x for x in self.workerList if x.running == True]
-        for worker in workersRunning:
-            result.append(worker)
-        return result
+        with self.condition:
+            return [ x for x in self.workers.values() if x.running == True ]
 
     def getError(self, id):
         result = None
-        worker = [x for x in self.workerList if x.id == id]
+        worker = self.get(id)
         if worker:
-            worker = worker[0]
             result = worker.resultException
             worker.resultException = None
         return result
     
+    # Only finished workers can be deleted, they are removed from the history
     def delete(self, id):
-        worker = [x for x in self.workerList if x.id == id]
+        with self.condition:
+            worker = self.workersFinishedIndex.pop(id,None)
+            if worker:
+                self.workersFinished.remove(worker)
         if worker:
-            worker = worker[0]
             if jimi.logging.debugEnabled:
                 jimi.logging.debug("Deleted worker, workerID={0}".format(id))
-            del worker
         else:
             if jimi.logging.debugEnabled:
                 jimi.logging.debug("Unable to locate worker, workerID={0}".format(id))
 
     def kill(self, id):
-        worker = [x for x in self.workerList if x.id == id]
-        if worker:
-            worker = worker[0]
-            worker.thread.kill()
+        worker = self.workers.get(id)
+        if worker and worker.running == True:
+            worker.kill()
             if jimi.logging.debugEnabled:
                 jimi.logging.debug("Killed worker, workerID={0}".format(id))
         else:
@@ -287,55 +487,399 @@ class workerHandler:
                 jimi.logging.debug("Unable to locate worker, workerID={0}".format(id))
 
     def wait(self, jid):
-        worker = [x for x in self.workerList if x.id == jid][0]
+        worker = self.get(jid)
         if jimi.logging.debugEnabled:
-            jimi.logging.debug("Waiting for worker, workerID={0}".format(id))
+            jimi.logging.debug("Waiting for worker, workerID={0}".format(jid))
         if worker:
-            while (worker.running != False ):
-                time.sleep(0.1)
+            with self.condition:
+                while (worker.running != False ):
+                    self.condition.wait(1)
 
     def waitAll(self):
-        while (self.queue() > 0 or len(self.active()) > 0):
-            time.sleep(0.1)
+        with self.condition:
+            while (self.workersWaiting or self.workersRunning):
+                self.condition.wait(1)
 
     def activeCount(self):
-        workersRunning = [x for x in self.workerList if x.id != self.workerID and x.running == True]
-        return len(workersRunning)
+        return len(self.workersRunning)
 
     def failureCount(self):
-        crashedWorkers = [x for x in self.workerList if x.id != self.workerID and x.crash == True]
-        return len(crashedWorkers)
+        return self.crashCount
 
     def active(self):
-        result = []
-        workersRunning = [x for x in self.workerList if x.id != self.workerID and x.running == True]
-        for workerRunning in workersRunning:
-            result.append(workerRunning.name)
-        return result
+        with self.condition:
+            return [ x.name for x in self.workersRunning.values() if x.running == True ]
 
     def count(self):
-        return len(self.workerList)
+        return len(self.workers) + len(self.workersFinished)
 
     def countIncomplete(self):
-        return self.queue() + len(self.active())
+        return len(self.workersWaiting) + len(self.workersRunning)
 
     def queue(self):
-        workersWaiting = [x for x in self.workerList if x.running == None]
-        return len(workersWaiting)
+        return len(self.workersWaiting)
+
+    # Queue wait time per priority class
+    def queueStats(self):
+        with self.condition:
+            return self.workersWaiting.getStats()
+
+    def queuedKeys(self):
+        with self.condition:
+            return self.workersWaiting.queuedKeys()
+
+    # queueKeys with a waiting or running worker
+    def pendingKeys(self):
+        with self.condition:
+            return self.workersWaiting.queuedKeys() | set([ worker.queueKey for worker in self.workersRunning.values() ])
 
 workerSettings = jimi.settings.getSetting("workers",None)
 
 multiprocessing.set_start_method("spawn",force=True)
 
-def multiprocessingThreadStart(Q,threadCall,args):
-    rc = 0
-    error = None
+# Bound methods of triggers, actions and conducts are sent to the process pool as a reference and loaded again by the child, anything else is pickled as is
+def getCallReference(call):
+    callObject = getattr(call,"__self__",None)
+    if callObject is not None and getattr(callObject,"_id",None):
+        for modelType, modelClass in (("trigger",jimi.trigger._trigger),("action",jimi.action._action),("conduct",jimi.conduct._conduct)):
+            if isinstance(callObject,modelClass):
+                return (modelType,callObject._id,call.__name__)
+    return ("call",call)
+
+def resolveCallReference(callReference):
+    if callReference[0] == "call":
+        return callReference[1]
+    modelClass = { "trigger" : jimi.trigger._trigger, "action" : jimi.action._action, "conduct" : jimi.conduct._conduct }[callReference[0]]
+    return getattr(modelClass(False).getAsClass(id=callReference[1])[0],callReference[2])
+
+# Child process entry point, jimi is imported once when the child starts and the child then runs tasks until told to stop or it is due for recycling
+def processPoolStart(taskQueue,resultQueue,recycleJobs,maxRSS):
+    jobs = 0
+    while True:
+        task = taskQueue.get()
+        if task is None:
+            return
+        callReference, args = pickle.loads(task)
+        rc = 0
+        error = None
+        try:
+            resolveCallReference(callReference)(*args)
+        except Exception as e:
+            error = e
+            rc = 1
+        jobs += 1
+        recycle = recycleJobs > 0 and jobs >= recycleJobs
+        if not recycle and maxRSS > 0:
+            import psutil
+            recycle = psutil.Process().memory_info().rss > maxRSS * 1024 * 1024
+        resultQueue.put((rc,error,recycle))
+        if recycle:
+            return
+
+class _processPoolChild():
+    __slots__ = ("process","taskQueue","resultQueue")
+
+    def __init__(self,recycleJobs,maxRSS):
+        self.taskQueue = Queue()
+        self.resultQueue = Queue()
+        # Not daemonic so children are never left running tasks on exit, the pool terminates them in stop instead
+        self.process = Process(target=processPoolStart,args=(self.taskQueue,self.resultQueue,recycleJobs,maxRSS),name="jimi_processPool")
+        self.process.start()
+
+    def stop(self):
+        self.taskQueue.put(None)
+        self.close()
+
+    def terminate(self):
+        if self.process.exitcode == None:
+            self.process.terminate()
+        self.close()
+
+    def close(self):
+        self.taskQueue.close()
+        self.resultQueue.close()
+
+# Warm child processes for workers started with multiprocessing=True, children are started ahead of use and reused between tasks
+class _processPool():
+    def __init__(self,size,recycleJobs=0,maxRSS=0):
+        self.size = size
+        self.recycleJobs = recycleJobs
+        self.maxRSS = maxRSS
+        self.lock = threading.Lock()
+        self.stopped = False
+        # Every child started by the pool whether idle or running a task
+        self.children = set()
+        self.idle = [ self.start() for index in range(size) ]
+
+    def start(self):
+        child = _processPoolChild(self.recycleJobs,self.maxRSS)
+        with self.lock:
+            if not self.stopped:
+                self.children.add(child)
+                return child
+        child.terminate()
+        raise RuntimeError("Process pool has been stopped")
+
+    # Returns an idle child or starts a new one when all children are busy
+    def acquire(self):
+        with self.lock:
+            while self.idle:
+                child = self.idle.pop()
+                if child.process.is_alive():
+                    return child
+                self.children.discard(child)
+                child.close()
+        return self.start()
+
+    # Children over the pool size are stopped instead of kept
+    def release(self,child):
+        with self.lock:
+            if not self.stopped and child.process.is_alive() and len(self.idle) < self.size:
+                self.idle.append(child)
+                return
+            self.children.discard(child)
+        child.stop()
+
+    # For children that are due for recycling or were stopped mid task
+    def discard(self,child,terminate=False):
+        with self.lock:
+            self.children.discard(child)
+        if terminate:
+            child.terminate()
+        else:
+            child.close()
+
+    def stop(self):
+        with self.lock:
+            self.stopped = True
+            children = list(self.children)
+            self.children = set()
+            self.idle = []
+        for child in children:
+            child.terminate()
+        for child in children:
+            child.process.join(1)
+
+processPool = None
+processPoolLock = threading.Lock()
+
+def getProcessPool():
+    global processPool
+    if not processPool:
+        with processPoolLock:
+            if not processPool:
+                poolSettings = workerSettings or {}
+                processPool = _processPool(poolSettings.get("processPoolSize",2),poolSettings.get("processPoolRecycleJobs",0),poolSettings.get("processPoolMaxRSS",0))
+                # Registered once the children exist so it runs ahead of the multiprocessing exit handler, which would otherwise wait on the non daemonic children
+                atexit.register(stopProcessPool)
+    return processPool
+
+# Terminates every pool child, a later multiprocessing worker starts a new pool
+def stopProcessPool():
+    global processPool
+    with processPoolLock:
+        pool = processPool
+        processPool = None
+    if pool:
+        pool.stop()
+
+eventLoop = None
+eventLoopLock = threading.Lock()
+
+# Per process asyncio event loop used by async actions, started on first use
+def getEventLoop():
+    global eventLoop
+    if not eventLoop:
+        with eventLoopLock:
+            if not eventLoop:
+                loop = asyncio.new_event_loop()
+                asyncThreads = None
+                if workerSettings:
+                    asyncThreads = workerSettings.get("asyncThreads")
+                if not asyncThreads:
+                    asyncThreads = 32
+                # Synchronous actions called from async flows are offloaded onto these threads
+                loop.set_default_executor(ThreadPoolExecutor(max_workers=asyncThreads,thread_name_prefix="asyncOffload"))
+                loopThread = _threading(target=loop.run_forever,name="asyncEventLoop",daemon=True)
+                loopThread.start()
+                eventLoop = loop
+    return eventLoop
+
+def inEventLoop():
+    try:
+        return eventLoop is not None and asyncio.get_running_loop() is eventLoop
+    except RuntimeError:
+        return False
+
+# Runs a coroutine on the event loop and blocks the calling thread until it completes, the coroutine is cancelled if the calling worker is killed
+def runCoroutine(coroutine,timeout=None):
+    # Blocking a thread of the event loop on the loop itself can leave nothing free to finish the coroutine, it gets a loop of its own instead
+    if inAsyncThread():
+        return runCoroutineOwnLoop(coroutine,timeout)
+    future = asyncio.run_coroutine_threadsafe(coroutine,getEventLoop())
+    try:
+        return future.result(timeout)
+    except BaseException:
+        future.cancel()
+        raise
+
+# True on a thread running an event loop or on one of the event loop offload threads
+def inAsyncThread():
+    try:
+        asyncio.get_running_loop()
+        return True
+    except RuntimeError:
+        return threading.current_thread().name.startswith("asyncOffload")
+
+# A thread already running a loop cannot start another, the coroutine is then run from a thread of its own
+def runCoroutineOwnLoop(coroutine,timeout=None):
+    def runLoop():
+        loop = asyncio.new_event_loop()
+        try:
+            return loop.run_until_complete(asyncio.wait_for(coroutine,timeout))
+        finally:
+            loop.close()
     try:
-        threadCall(*args)
-    except Exception as e:
-        error = e
-        rc = 1
-    Q.put((rc,error))
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return runLoop()
+    with ThreadPoolExecutor(max_workers=1,thread_name_prefix="asyncInline") as executor:
+        return executor.submit(runLoop).result()
+
+async def runInThread(call,*args):
+    return await asyncio.get_running_loop().run_in_executor(None,call,*args)
+
+concurrentPool = None
+concurrentPoolLock = threading.Lock()
+
+# Process wide thread pool shared by all trigger and forEach concurrency, started on first use
+def getConcurrentPool():
+    global concurrentPool
+    if not concurrentPool:
+        with concurrentPoolLock:
+            if not concurrentPool:
+                poolThreads = None
+                if workerSettings:
+                    poolThreads = workerSettings.get("concurrentThreads")
+                if not poolThreads:
+                    poolThreads = 64
+                concurrentPool = ThreadPoolExecutor(max_workers=poolThreads,thread_name_prefix="concurrent")
+    return concurrentPool
+
+# One callers share of the concurrent pool, no more than quota of its jobs are submitted to the pool at once and the rest wait in its own backlog
+class concurrentGroup():
+    def __init__(self,quota):
+        self.quota = max(quota,1)
+        self.lock = threading.Condition()
+        self.backlog = collections.deque()
+        # Jobs submitted to the pool and not yet finished
+        self.jobs = set()
+        self.incomplete = 0
+        self.failures = False
+        self.exceptions = []
+
+    def new(self,call,args=()):
+        job = _concurrentJob(call,args)
+        with self.lock:
+            # Nothing more is started once a job has failed or the group was cancelled
+            if self.failures:
+                return
+            self.incomplete += 1
+            if len(self.jobs) >= self.quota:
+                self.backlog.append(job)
+                return
+            self.jobs.add(job)
+        job.future = getConcurrentPool().submit(self.run,job)
+
+    def run(self,job):
+        self.runJob(job)
+        with self.lock:
+            self.jobs.discard(job)
+            nextJob = None
+            if self.backlog:
+                nextJob = self.backlog.popleft()
+                self.jobs.add(nextJob)
+        if nextJob:
+            nextJob.future = getConcurrentPool().submit(self.run,nextJob)
+
+    def runJob(self,job):
+        try:
+            job.call(*job.args)
+        except Exception as e:
+            with self.lock:
+                self.failures = True
+                self.exceptions.append(''.join(traceback.format_exception(type(e),e,e.__traceback__)))
+            self.cancel()
+        finally:
+            with self.lock:
+                self.incomplete -= 1
+                self.lock.notify_all()
+
+    def countIncomplete(self):
+        return self.incomplete
+
+    # Blocks the caller until fewer than limit jobs are queued or running
+    def waitIncomplete(self,limit):
+        while self.incomplete >= limit:
+            if not self.runWaiting():
+                with self.lock:
+                    if self.incomplete >= limit:
+                        # Short wait when no job has started yet i.e. the pool is busy with the caller itself
+                        self.lock.wait(None if self.jobs and any([ job.future and job.future.running() for job in self.jobs ]) else 0.01)
+
+    # Runs one backlog job or one job still queued in the pool on the calling thread so nested groups cannot starve the pool, returns False when there was none
+    def runWaiting(self):
+        with self.lock:
+            job = self.backlog.popleft() if self.backlog else None
+            jobs = list(self.jobs) if not job else []
+        if not job:
+            for queuedJob in jobs:
+                if queuedJob.future and queuedJob.future.cancel():
+                    with self.lock:
+                        self.jobs.discard(queuedJob)
+                    job = queuedJob
+                    break
+        if job:
+            self.runJob(job)
+            return True
+        return False
+
+    # Drops the backlog and every job the pool has not started, jobs already running are left to finish
+    def cancel(self):
+        with self.lock:
+            self.failures = True
+            cancelled = len(self.backlog)
+            self.backlog.clear()
+            for job in list(self.jobs):
+                if job.future and job.future.cancel():
+                    self.jobs.discard(job)
+                    cancelled += 1
+            self.incomplete -= cancelled
+            self.lock.notify_all()
+
+    # Waiting jobs are run by the calling thread until timeout has passed, returns False when any job failed or did not finish within timeout. A timeout of zero or less waits without limit
+    def waitAll(self,timeout=None):
+        deadline = None
+        if timeout is not None and timeout > 0:
+            deadline = time.time() + timeout
+        while ( deadline is None or time.time() < deadline ) and self.runWaiting():
+            pass
+        with self.lock:
+            if deadline is None:
+                self.lock.wait_for(lambda: self.incomplete == 0)
+            # A job run by the calling thread can itself finish after the deadline
+            elif time.time() >= deadline or not self.lock.wait_for(lambda: self.incomplete == 0,deadline - time.time()):
+                self.exceptions.append("Concurrent jobs exceeded their maximum duration, incomplete={0}".format(self.incomplete))
+                self.cancel()
+        return not self.failures
+
+class _concurrentJob():
+    __slots__ = ("call","args","future")
+
+    def __init__(self,call,args):
+        self.call = call
+        self.args = args
+        self.future = None
 
 ######### --------- API --------- #########
 if jimi.api.webServer:
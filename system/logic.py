@@ -1,61 +1,80 @@
 import re
+import functools
 
 from core import logging, helpers, function
 
-regexLogicString = re.compile(r'((\"(.*?[^\\])\"|([a-zA-Z0-9]+(\[(.*?)\])+)|([a-zA-Z0-9]+(\((.*?)(\)\)|\)))+)|\[(.*?)\]|([a-zA-Z0-9]*)))\s?( not match | match | not in | in |==|!=|>=|>|<=|<)\s?((\"(.*?[^\\])\"|([a-zA-Z0-9]+(\[(.*?)\])+)|([a-zA-Z0-9]+(\((.*?)(\)\)|\))( |$))+)|\[(.*?)\]|([a-zA-Z0-9]*)))')
-regexLogicSafeValidationString = re.compile(r'^(True|False|\(|\)| |or|and|not)*$')
+logicCacheSize = 4096
+
+regexLogicWord = re.compile(r'[a-zA-Z0-9_.\-]*')
+regexLogicKeyword = re.compile(r'(and|or|not)(?![a-zA-Z0-9_.\-\[])')
+regexLogicOperator = re.compile(r'\s*(==|!=|>=|<=|>|<|not match(?=[\s\"\[\(])|match(?=[\s\"\[\(])|not in(?=[\s\"\[\(])|in(?=[\s\"\[\(]))')
 
 def ifEval(logicString,dicts={},debug=False):
-    functionSafeList = function.systemFunctions
     if "if " == logicString[:3]:
-        tempLogic = logicString[3:]
-        explainLogin = tempLogic
-        logicMatches = regexLogicString.finditer(tempLogic)
-        for index, logicMatch in enumerate(logicMatches, start=1):
-            statement = [logicMatch.group(1).strip(),logicMatch.group(14).strip(),logicMatch.group(13).strip()]
-            # Cast typing statement vars
-            for x in range(0,2):
-                statement[x] = helpers.typeCast(statement[x],dicts,functionSafeList)
-            tempLogic = tempLogic.replace(logicMatch.group(0),str(logicProcess(statement)))
-            explainLogin = explainLogin.replace(logicMatch.group(0),str(statement))
-        # Checking that result only includes True, False, ( ), or, and,
-        if regexLogicSafeValidationString.search(tempLogic):
-            result = eval(tempLogic) # Can be an unsafe call be very careful with this!
+        functionSafeList = function.systemFunctions
+        compiledLogic = compileLogic(logicString)
+        if compiledLogic:
             if debug:
-                return result, tempLogic, explainLogin
-            return result
+                return compiledLogic.explain(dicts,functionSafeList)
+            return compiledLogic.evaluate(dicts,functionSafeList)
         else:
             if logging.debugEnabled:
-                logging.debug("Action logicEval tempLogic contains unsafe items, tempLogic='{0}'".format(tempLogic),3)
+                logging.debug("Action logicEval logicString could not be compiled, logicString='{0}'".format(logicString),3)
+            if debug:
+                return False, "False", logicString[3:]
     else:
         return True
     return False
 
+# Evaluates one logic string over a list of dicts in a single pass, returns a list of results in the same order
+def ifEvalBatch(logicString,dictsList):
+    if "if " == logicString[:3]:
+        compiledLogic = compileLogic(logicString)
+        if compiledLogic:
+            return compiledLogic.evaluateBatch(dictsList,function.systemFunctions)
+        if logging.debugEnabled:
+            logging.debug("Action logicEval logicString could not be compiled, logicString='{0}'".format(logicString),3)
+        return [ False for dicts in dictsList ]
+    return [ True for dicts in dictsList ]
+
+# Logic strings are parsed once into a tree of logic nodes and cached by string, returns None when the string is not valid logic
+@functools.lru_cache(maxsize=logicCacheSize)
+def compileLogic(logicString):
+    try:
+        return _logicParser(logicString[3:]).parse()
+    except SyntaxError as e:
+        if logging.debugEnabled:
+            logging.debug("Logic compile failed, logicString='{0}', error='{1}'".format(logicString,e),5)
+    return None
+
 def logicProcess(statement):
+    return logicCompare(statement[0],statement[1],statement[2].strip())
+
+def logicCompare(left,right,operator):
     try:
-        if statement[2] == "==":
-            return (statement[0] == statement[1])
-        elif statement[2] == "!=":
-            return (statement[0] != statement[1])
-        elif statement[2] == ">":
-            return (statement[0] > statement[1])
-        elif statement[2] == ">=":
-            return (statement[0] >= statement[1])
-        elif statement[2] == "<":
-            return (statement[0] < statement[1])
-        elif statement[2] == "<=":
-            return (statement[0] <= statement[1])
-        elif statement[2] == "in":
-            return (statement[0] in statement[1])
-        elif statement[2] == "not in":
-            return (statement[0] not in statement[1])
-        elif statement[2].startswith("match"):
-            if re.search(statement[1],statement[0]):
+        if operator == "==":
+            return (left == right)
+        elif operator == "!=":
+            return (left != right)
+        elif operator == ">":
+            return (left > right)
+        elif operator == ">=":
+            return (left >= right)
+        elif operator == "<":
+            return (left < right)
+        elif operator == "<=":
+            return (left <= right)
+        elif operator == "in":
+            return (left in right)
+        elif operator == "not in":
+            return (left not in right)
+        elif operator.startswith("match"):
+            if re.search(right,left):
                 return True
             else:
                 return False
-        elif statement[2].startswith("not match"):
-            if re.search(statement[1],statement[0]):
+        elif operator.startswith("not match"):
+            if re.search(right,left):
                 return False
             else:
                 return True
@@ -63,8 +82,263 @@ def logicProcess(statement):
             return False
     except:
         if logging.debugEnabled:
-            logging.debug("logicProcess process failed, statement='{0}'".format(statement),5)
+            logging.debug("logicProcess process failed, statement='{0}'".format([left,right,operator]),5)
         return False
 
+class _logicCompare():
+    __slots__ = ("left","right","operator","constant","rightValue","rightSet")
+
+    def __init__(self,left,right,operator):
+        self.left = left
+        self.right = right
+        self.operator = operator
+        # Constant and literal right hand values are folded at compile time, comparisons never modify them so no copy is needed
+        self.constant = type(right) in (helpers._constantExpression,helpers._literalExpression)
+        self.rightValue = right.value if self.constant else None
+        # Membership against a literal list of hashable values uses a frozenset
+        self.rightSet = None
+        if self.constant and operator in ("in","not in") and type(self.rightValue) is list:
+            try:
+                self.rightSet = frozenset(self.rightValue)
+            except TypeError:
+                pass
+
+    def evaluate(self,dicts,functionSafeList):
+        if self.rightSet is not None:
+            return self.compareSet(helpers.evaluateExpression(self.left,dicts,functionSafeList))
+        if self.constant:
+            return logicCompare(helpers.evaluateExpression(self.left,dicts,functionSafeList),self.rightValue,self.operator)
+        return logicCompare(helpers.evaluateExpression(self.left,dicts,functionSafeList),helpers.evaluateExpression(self.right,dicts,functionSafeList),self.operator)
+
+    def evaluateBatch(self,dictsList,functionSafeList):
+        leftValues = [ helpers.evaluateExpression(self.left,dicts,functionSafeList) for dicts in dictsList ]
+        if self.rightSet is not None:
+            return [ self.compareSet(leftValue) for leftValue in leftValues ]
+        if self.constant:
+            return [ logicCompare(leftValue,self.rightValue,self.operator) for leftValue in leftValues ]
+        return [ logicCompare(leftValue,helpers.evaluateExpression(self.right,dicts,functionSafeList),self.operator) for leftValue, dicts in zip(leftValues,dictsList) ]
+
+    def compareSet(self,left):
+        try:
+            result = left in self.rightSet
+        except TypeError:
+            # Unhashable values i.e. lists fall back to the list scan
+            return logicCompare(left,self.rightValue,self.operator)
+        if self.operator == "in":
+            return result
+        return not result
+
+    def explain(self,dicts,functionSafeList):
+        statement = [helpers.evaluateExpression(self.left,dicts,functionSafeList),helpers.evaluateExpression(self.right,dicts,functionSafeList),self.operator]
+        result = logicCompare(statement[0],statement[1],statement[2])
+        return result, str(result), str(statement)
+
+class _logicConstant():
+    __slots__ = ("value",)
+
+    def __init__(self,value):
+        self.value = value
+
+    def evaluate(self,dicts,functionSafeList):
+        return self.value
+
+    def evaluateBatch(self,dictsList,functionSafeList):
+        return [ self.value for dicts in dictsList ]
+
+    def explain(self,dicts,functionSafeList):
+        return self.value, str(self.value), str(self.value)
+
+class _logicNot():
+    __slots__ = ("operand",)
+
+    def __init__(self,operand):
+        self.operand = operand
+
+    def evaluate(self,dicts,functionSafeList):
+        return not self.operand.evaluate(dicts,functionSafeList)
+
+    def evaluateBatch(self,dictsList,functionSafeList):
+        return [ not result for result in self.operand.evaluateBatch(dictsList,functionSafeList) ]
+
+    def explain(self,dicts,functionSafeList):
+        result, evalLogic, explainLogic = self.operand.explain(dicts,functionSafeList)
+        return not result, "not {0}".format(evalLogic), "not {0}".format(explainLogic)
+
+# And / Or short circuit, operands ( including function calls ) after the deciding operand are never evaluated
+class _logicAnd():
+    __slots__ = ("operands",)
+    joinWord = " and "
+    decidingResult = False
+
+    def __init__(self,operands):
+        self.operands = operands
+
+    def evaluate(self,dicts,functionSafeList):
+        for operand in self.operands:
+            if not operand.evaluate(dicts,functionSafeList):
+                return False
+        return True
+
+    # Each operand is only evaluated for the entries that are still undecided
+    def evaluateBatch(self,dictsList,functionSafeList):
+        results = [ not self.decidingResult for dicts in dictsList ]
+        undecided = list(range(len(dictsList)))
+        for operand in self.operands:
+            if not undecided:
+                break
+            operandResults = operand.evaluateBatch([ dictsList[index] for index in undecided ],functionSafeList)
+            stillUndecided = []
+            for index, operandResult in zip(undecided,operandResults):
+                if bool(operandResult) == self.decidingResult:
+                    results[index] = self.decidingResult
+                else:
+                    stillUndecided.append(index)
+            undecided = stillUndecided
+        return results
+
+    def explain(self,dicts,functionSafeList):
+        result, evalLogic, explainLogic = not self.decidingResult, [], []
+        for operand in self.operands:
+            if result == self.decidingResult:
+                evalLogic.append("skipped")
+                explainLogic.append("skipped")
+                continue
+            operandResult = operand.explain(dicts,functionSafeList)
+            if bool(operandResult[0]) == self.decidingResult:
+                result = self.decidingResult
+            if type(operand) in (_logicAnd,_logicOr):
+                evalLogic.append("({0})".format(operandResult[1]))
+                explainLogic.append("({0})".format(operandResult[2]))
+            else:
+                evalLogic.append(operandResult[1])
+                explainLogic.append(operandResult[2])
+        return result, self.joinWord.join(evalLogic), self.joinWord.join(explainLogic)
+
+class _logicOr(_logicAnd):
+    __slots__ = ()
+    joinWord = " or "
+    decidingResult = True
+
+    def evaluate(self,dicts,functionSafeList):
+        for operand in self.operands:
+            if operand.evaluate(dicts,functionSafeList):
+                return True
+        return False
+
+# Recursive decent parser for logic strings i.e. ( data["event"]["a"] == 1 or lower(data["event"]["b"]) in ["x","y"] ) and not 1 > 2
+class _logicParser():
+    def __init__(self,logicString):
+        self.logicString = logicString
+        self.index = 0
+
+    def parse(self):
+        result = self.parseOr()
+        self.skipSpaces()
+        if self.index != len(self.logicString):
+            raise SyntaxError("Unexpected '{0}' at position {1}".format(self.logicString[self.index:],self.index))
+        return result
+
+    def skipSpaces(self):
+        while self.index < len(self.logicString) and self.logicString[self.index].isspace():
+            self.index += 1
+
+    def keyword(self,word):
+        self.skipSpaces()
+        match = regexLogicKeyword.match(self.logicString,self.index)
+        if match and match.group(1) == word:
+            self.index = match.end()
+            return True
+        return False
+
+    def parseOr(self):
+        operands = [self.parseAnd()]
+        while self.keyword("or"):
+            operands.append(self.parseAnd())
+        if len(operands) == 1:
+            return operands[0]
+        return _logicOr(operands)
+
+    def parseAnd(self):
+        operands = [self.parseNot()]
+        while self.keyword("and"):
+            operands.append(self.parseNot())
+        if len(operands) == 1:
+            return operands[0]
+        return _logicAnd(operands)
+
+    def parseNot(self):
+        if self.keyword("not"):
+            return _logicNot(self.parseNot())
+        return self.parsePrimary()
+
+    def parsePrimary(self):
+        self.skipSpaces()
+        if self.index < len(self.logicString) and self.logicString[self.index] == "(":
+            self.index += 1
+            result = self.parseOr()
+            self.skipSpaces()
+            if self.index >= len(self.logicString) or self.logicString[self.index] != ")":
+                raise SyntaxError("Missing ')' at position {0}".format(self.index))
+            self.index += 1
+            return result
+        left = self.parseOperand()
+        operator = regexLogicOperator.match(self.logicString,self.index)
+        if not operator:
+            # Lone True / False is valid logic, any other operand without a comparison is not
+            if left in ("True","False"):
+                return _logicConstant(left == "True")
+            raise SyntaxError("Expected comparison operator at position {0}".format(self.index))
+        self.index = operator.end()
+        right = self.parseOperand()
+        return _logicCompare(helpers.compileExpression(left),helpers.compileExpression(right),operator.group(1))
+
+    def parseOperand(self):
+        self.skipSpaces()
+        start = self.index
+        if self.index >= len(self.logicString):
+            raise SyntaxError("Expected value at end of logic")
+        char = self.logicString[self.index]
+        if char == "\"":
+            self.skipQuoted()
+        elif char in "[{":
+            self.skipBracketed()
+        else:
+            self.index = regexLogicWord.match(self.logicString,self.index).end()
+            if self.index < len(self.logicString):
+                if self.logicString[self.index] == "(" and self.index > start:
+                    self.skipBracketed()
+                else:
+                    while self.index < len(self.logicString) and self.logicString[self.index] == "[" and self.index > start:
+                        self.skipBracketed()
+        if self.index == start:
+            raise SyntaxError("Expected value at position {0}".format(start))
+        return self.logicString[start:self.index]
+
+    def skipQuoted(self):
+        self.index += 1
+        while self.index < len(self.logicString):
+            char = self.logicString[self.index]
+            self.index += 1
+            if char == "\\":
+                self.index += 1
+            elif char == "\"":
+                return
+        raise SyntaxError("Unterminated string")
 
-            
\ No newline at end of file
+    def skipBracketed(self):
+        closing = { "(" : ")", "[" : "]", "{" : "}" }
+        stack = []
+        while self.index < len(self.logicString):
+            char = self.logicString[self.index]
+            if char == "\"":
+                self.skipQuoted()
+                continue
+            if char in closing:
+                stack.append(closing[char])
+            elif stack and char == stack[-1]:
+                stack.pop()
+                if not stack:
+                    self.index += 1
+                    return
+            self.index += 1
+        raise SyntaxError("Unbalanced brackets")
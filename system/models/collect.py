@@ -1,13 +1,27 @@
 import time
+import os
+import json
+import uuid
+import threading
+from pathlib import Path
 
 from core.models import action, conduct, webui
 from core import helpers, logging, cache, settings
 
+import jimi
+
+spillDir = str(Path("data/temp/collect"))
+# Module level as jsonToClass rebuilds every non callable instance attribute when loading the action
+buffersLock = threading.Lock()
+
 class _collect(action._action):
 	limit = int()
+	maxSize = int()
+	maxAge = int()
+	spillSize = int()
 
 	def __init__(self):
-		self.events = []
+		self.buffers = {}
 
 	def doAction(self,data):
 		try:
@@ -16,23 +30,135 @@ class _collect(action._action):
 				return { "result" : True, "rc" : 0 }
 		except KeyError:
 			pass
-		
-		self.events.append(data["flowData"]["event"])
-		self.data = data
-		if self.limit != 0 and self.limit < len(self.events):
-			self.continueFlow()
+
+		# Each run of the conduct collects into its own buffer, all events within one run share the same persistentData
+		runID = id(data["persistentData"])
+		flushBuffers = []
+		with buffersLock:
+			try:
+				collectBuffer = self.buffers[runID]
+			except KeyError:
+				collectBuffer = _collectBuffer(data)
+				self.buffers[runID] = collectBuffer
+			collectBuffer.add(self,data)
+			# postRun follows the last event of a run and only flushes the runs that have seen their last event
+			try:
+				if data["flowData"]["eventStats"]["last"]:
+					collectBuffer.ending = True
+			except KeyError:
+				pass
+			if collectBuffer.due(self):
+				flushBuffers.append(self.buffers.pop(runID))
+			flushBuffers += self.popStale()
+		for flushBuffer in flushBuffers:
+			self.continueFlow(flushBuffer)
 
 		# Returning false to stop flow continue
 		return { "result" : False, "rc" : 9 }
 
-	def continueFlow(self):
-		if self.events:
-			tempDataCopy = conduct.copyData(self.data)
-			tempDataCopy["flowData"]["event"] = self.events
+	def continueFlow(self,collectBuffer):
+		for index, (events, last) in enumerate(collectBuffer.flush(self)):
+			tempDataCopy = conduct.copyData(collectBuffer.data)
+			tempDataCopy["flowData"]["event"] = events
 			tempDataCopy["flowData"]["skip"] = 1
-			self.events = []
-			tempDataCopy["flowData"]["eventStats"] = { "first" : True, "current" : 0, "total" : 1, "last" : True }
-			self.data["persistentData"]["system"]["conduct"].triggerHandler(self.data["flowData"]["flow_id"],tempDataCopy,flowIDType=True)
+			tempDataCopy["flowData"]["eventStats"] = { "first" : index == 0, "current" : index, "total" : index + 1 if last else None, "last" : last }
+			collectBuffer.data["persistentData"]["system"]["conduct"].triggerHandler(collectBuffer.data["flowData"]["flow_id"],tempDataCopy,flowIDType=True)
 
 	def postRun(self):
-		self.continueFlow()
+		with buffersLock:
+			collectBuffers = [ collectBuffer for collectBuffer in self.buffers.values() if collectBuffer.ending ]
+			for collectBuffer in collectBuffers:
+				del self.buffers[id(collectBuffer.persistentData)]
+			collectBuffers += self.popStale()
+		for collectBuffer in collectBuffers:
+			self.continueFlow(collectBuffer)
+
+	# Runs that stopped before their last event never reach postRun, their buffers are removed once past maxAge or idle for longer than staleAge. Called with buffersLock held
+	def popStale(self):
+		staleAge = jimi.settings.getSetting("collect","staleAge")
+		if not staleAge:
+			staleAge = 3600
+		now = time.time()
+		staleBuffers = [ collectBuffer for collectBuffer in self.buffers.values() if collectBuffer.due(self) or now - collectBuffer.lastTime >= staleAge ]
+		for collectBuffer in staleBuffers:
+			del self.buffers[id(collectBuffer.persistentData)]
+		return staleBuffers
+
+# Events collected by one conduct run. Once spillSize bytes are held in memory the events are appended to a local file and streamed back in spillSize chunks on flush
+class _collectBuffer():
+	__slots__ = ("persistentData","data","events","count","size","memorySize","startTime","lastTime","spillFilename","ending")
+
+	def __init__(self,data):
+		# Held so that the id used as the run key cannot be reused while the buffer exists
+		self.persistentData = data["persistentData"]
+		self.data = data
+		self.events = []
+		self.count = 0
+		self.size = 0
+		self.memorySize = 0
+		self.startTime = time.time()
+		self.lastTime = self.startTime
+		self.spillFilename = None
+		self.ending = False
+
+	def add(self,collect,data):
+		event = data["flowData"]["event"]
+		self.data = data
+		self.lastTime = time.time()
+		self.count += 1
+		# Sizes are only measured when a size based policy is set as it costs a json dump per event
+		if collect.maxSize > 0 or collect.spillSize > 0:
+			eventSize = len(json.dumps(event,default=str))
+			self.size += eventSize
+			self.memorySize += eventSize
+		self.events.append(event)
+		if collect.spillSize > 0 and self.memorySize >= collect.spillSize:
+			self.spill(collect)
+
+	def due(self,collect):
+		if collect.limit > 0 and self.count > collect.limit:
+			return True
+		if collect.maxSize > 0 and self.size >= collect.maxSize:
+			return True
+		if collect.maxAge > 0 and time.time() - self.startTime >= collect.maxAge:
+			return True
+		return False
+
+	def spill(self,collect):
+		if not self.spillFilename:
+			if not os.path.isdir(spillDir):
+				os.makedirs(spillDir,exist_ok=True)
+			self.spillFilename = str(Path("{0}/{1}_{2}.jsonl".format(spillDir,collect._id,uuid.uuid4())))
+		with open(self.spillFilename,"a") as f:
+			for event in self.events:
+				f.write(json.dumps(event,default=str))
+				f.write("\n")
+		self.events = []
+		self.memorySize = 0
+
+	# Yields ( events, last ) for every chunk to pass onto the flow, a buffer that never spilled is a single chunk
+	def flush(self,collect):
+		if not self.spillFilename:
+			if self.events:
+				yield self.events, True
+			return
+		if self.events:
+			self.spill(collect)
+		try:
+			with open(self.spillFilename) as f:
+				chunk = []
+				chunkSize = 0
+				for line in f:
+					if chunkSize >= collect.spillSize:
+						yield chunk, False
+						chunk = []
+						chunkSize = 0
+					chunk.append(json.loads(line))
+					chunkSize += len(line) - 1
+				if chunk:
+					yield chunk, True
+		finally:
+			try:
+				os.remove(self.spillFilename)
+			except OSError as e:
+				jimi.logging.debug("Error: Unable to remove collect spill file. filename={0}, error={1}".format(self.spillFilename,e),-1)
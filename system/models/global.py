@@ -27,7 +27,7 @@ class _globalSet(action._action):
 				var.update(["globalValue"])
 		except:
 			_global().new(self.acl,globalName,globalValue)
-		data["var"]["global."+globalName] = helpers.typeCast(globalValue,{ "data" : data })
+		data["var"]["global."+globalName] = helpers.typeCast(globalValue,{ "data" : data },cached=False)
 		actionResult["result"] = True
 		actionResult["rc"] = 0
 		return actionResult
@@ -39,7 +39,7 @@ class _globalGet(action._action):
 		globalName = helpers.evalString(self.globalName,{"data" : data})
 		try:
 			var =  _global().getAsClass(query={"name" : globalName})[0]
-			data["var"]["global."+globalName] = helpers.typeCast(var.globalValue,{ "data" : data })
+			data["var"]["global."+globalName] = helpers.typeCast(var.globalValue,{ "data" : data },cached=False)
 			actionResult["result"] = True
 			actionResult["rc"] = 0
 		except Exception as e:
@@ -1,5 +1,7 @@
 import jimi
 
+jimi.cache.globalCache.newCache("subFlowTriggerCache")
+
 class _subFlow(jimi.action._action):
 	triggerID = str()
 	customEventsValue = False
@@ -25,10 +27,10 @@ class _subFlow(jimi.action._action):
 		if self.customEventsList:
 			events = jimi.helpers.evalList(self.eventsList,{"data" : data["flowData"]})
 
-		trigger = jimi.trigger._trigger().getAsClass(id=triggerID)
-		if len(trigger) == 1:
+		trigger = jimi.cache.globalCache.get("subFlowTriggerCache",triggerID,getTrigger)
+		if trigger and len(trigger) == 1:
 			trigger = trigger[0]
-			finalData = trigger.notify(events,tempData)
+			finalData = trigger.notify(events,tempData,inline=True)
 			if self.mergeFinalDataValue:
 				data["flowData"]["action"] = finalData["flowData"]["action"]
 				data["flowData"]["var"] = finalData["flowData"]["var"]
@@ -43,3 +45,6 @@ class _subFlow(jimi.action._action):
 			return { "result" : False, "rc" : 5, "msg" : "Unable to find the specified triggerID={0}".format(triggerID) }
 
 		return { "result" : True, "rc" : 0 }
+
+def getTrigger(triggerID,sessionData):
+	return jimi.trigger._trigger().getAsClass(id=triggerID)
@@ -1,3 +1,6 @@
+import collections
+import threading
+
 import jimi
 from core import logging, helpers, function
 from system import logic
@@ -45,3 +48,96 @@ def doVarEval(key,value,currentVarDict,functionSafeList,dicts,scope):
             return True
     return False
 
+
+scopeDataTypes = ["flowData","eventData","conductData","persistentData"]
+
+compiledVarDefinitionsCacheSize = 4096
+# Least recently used compiled var definitions keyed by the id of their varDefinitions dict, entries hold the dict so its id cannot be reused while cached
+compiledVarDefinitionsCache = collections.OrderedDict()
+compiledVarDefinitionsLock = threading.Lock()
+
+# Returns the compiled var definitions for a varDefinitions dict, compiled once and reused until the dict is replaced
+def getCompiledVarDefinitions(varDefinitions):
+    cacheKey = id(varDefinitions)
+    with compiledVarDefinitionsLock:
+        compiledVarDefinitions = compiledVarDefinitionsCache.get(cacheKey)
+        if compiledVarDefinitions and compiledVarDefinitions.varDict is varDefinitions:
+            compiledVarDefinitionsCache.move_to_end(cacheKey)
+            return compiledVarDefinitions
+    compiledVarDefinitions = _compiledVarDefinitions(varDefinitions)
+    with compiledVarDefinitionsLock:
+        compiledVarDefinitionsCache[cacheKey] = compiledVarDefinitions
+        compiledVarDefinitionsCache.move_to_end(cacheKey)
+        while len(compiledVarDefinitionsCache) > compiledVarDefinitionsCacheSize:
+            compiledVarDefinitionsCache.popitem(last=False)
+    return compiledVarDefinitions
+
+# Single pass over all four scopes sharing one dicts context, only the definitions belonging to each scope are evaluated
+def varEvalScopes(classObject,data,dicts):
+    try:
+        compiledVarDefinitions = getCompiledVarDefinitions(classObject.varDefinitions)
+    except Exception as e:
+        raise jimi.exceptions.variableDefineFailure(classObject.varDefinitions,e)
+    compiledVarDefinitions(data,dicts)
+
+class _compiledVarDefinitions():
+    __slots__ = ("varDict","scopes")
+
+    def __init__(self,varDict):
+        self.varDict = varDict
+        self.scopes = [ [] for scopeDataType in scopeDataTypes ]
+        for key, value in varDict.items():
+            if type(value) is dict:
+                value = [value]
+            scopeValues = [ [] for scopeDataType in scopeDataTypes ]
+            for valueItem in value:
+                varScope = valueItem["scope"] if "scope" in valueItem else 0
+                for scope in range(len(scopeDataTypes)):
+                    if varScope == scope:
+                        scopeValues[scope].append(_compiledVarDefinition(valueItem))
+                        break
+            for scope, compiledValues in enumerate(scopeValues):
+                if compiledValues:
+                    self.scopes[scope].append((key,compiledValues))
+
+    def __call__(self,data,dicts):
+        functionSafeList = function.systemFunctions
+        for varScope, scopeDataType in enumerate(scopeDataTypes):
+            if self.scopes[varScope]:
+                currentVarDict = data[scopeDataType]["var"]
+                try:
+                    for key, compiledValues in self.scopes[varScope]:
+                        for compiledValue in compiledValues:
+                            if compiledValue.apply(key,currentVarDict,dicts,functionSafeList):
+                                break
+                except Exception as e:
+                    raise jimi.exceptions.variableDefineFailure(self.varDict,e)
+
+class _compiledVarDefinition():
+    __slots__ = ("hasLogic","logic","value","template")
+
+    def __init__(self,value):
+        # Mirrors ifEval, only strings starting with "if " are logic and invalid logic never matches
+        self.hasLogic = "if" in value and value["if"][:3] == "if "
+        if self.hasLogic:
+            self.logic = logic.compileLogic(value["if"])
+        self.value = value["value"]
+        self.template = None
+        if type(self.value) is str:
+            self.template = helpers.compileTemplate(self.value)
+
+    def apply(self,key,currentVarDict,dicts,functionSafeList):
+        if self.hasLogic and not ( self.logic and self.logic.evaluate(dicts,functionSafeList) ):
+            return False
+        if self.template:
+            currentVarDict[key] = self.template.render(dicts,functionSafeList)
+        elif type(self.value) is dict:
+            if key in currentVarDict:
+                currentVarDict[key].update(helpers.evalDict(self.value,dicts,functionSafeList))
+            else:
+                currentVarDict[key] = helpers.evalDict(self.value,dicts,functionSafeList)
+        elif type(self.value) is list:
+            currentVarDict[key] = helpers.evalList(self.value,dicts,functionSafeList)
+        else:
+            currentVarDict[key] = self.value
+        return True
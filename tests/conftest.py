@@ -0,0 +1,55 @@
+import sys
+import types
+import collections
+from unittest import mock
+
+from bson.objectid import ObjectId
+
+# Tests run without data/settings.json or a database. A jimi module exposing what the core modules reach at import time is registered before any of them are loaded, every setting is unset so the modules fall back to their defaults
+settings = { "debug" : { "enabled" : False, "level" : -100 } }
+
+def getSetting(name,settingName):
+    try:
+        if settingName:
+            return settings[name][settingName]
+        return settings[name]
+    except KeyError:
+        return None
+
+class _document():
+    _id = str()
+    classID = str()
+    acl = dict()
+    lastUpdateTime = int()
+    creationTime = int()
+    createdBy = str()
+
+    def __init__(self,restrictClass=True):
+        pass
+
+jimi = types.ModuleType("jimi")
+jimi.config = { "system" : { "accessAddress" : "127.0.0.1", "accessPort" : 5015 }, "api" : { "core" : { "base" : "api/1.0" }, "proxy" : {} } }
+jimi.settings = types.SimpleNamespace(getSetting=getSetting,cpuSaver=None)
+jimi.api = types.SimpleNamespace(webServer=None)
+jimi.db = types.SimpleNamespace(_document=_document,db=collections.defaultdict(mock.MagicMock),ObjectId=ObjectId)
+jimi.audit = mock.MagicMock()
+sys.modules["jimi"] = jimi
+
+from core import function
+function.load()
+jimi.function = function
+from core import cache
+jimi.cache = cache
+from core import logging
+jimi.logging = logging
+from core import exceptions
+jimi.exceptions = exceptions
+from core import helpers
+jimi.helpers = helpers
+from system import logic, variable
+jimi.logic = logic
+jimi.variable = variable
+from core.models import conduct
+jimi.conduct = conduct
+from core import workers
+jimi.workers = workers
@@ -0,0 +1,45 @@
+from unittest import mock
+
+from system.models import collect
+
+def newData(event,last=False):
+    return { "flowData" : { "event" : event, "eventStats" : { "last" : last } }, "persistentData" : {}, "conductData" : {}, "eventData" : {} }
+
+def newCollect():
+    collectAction = collect._collect()
+    collectAction.continueFlow = mock.MagicMock()
+    return collectAction
+
+def test_collectFlushesEndingRunsOnPostRun():
+    collectAction = newCollect()
+    data = newData(1)
+    collectAction.doAction(data)
+    ending = newData(2,True)
+    ending["persistentData"] = data["persistentData"]
+    collectAction.doAction(ending)
+    collectAction.continueFlow.assert_not_called()
+    collectAction.postRun()
+    collectAction.continueFlow.assert_called_once()
+    assert collectAction.continueFlow.call_args[0][0].events == [1,2]
+    assert collectAction.buffers == {}
+
+def test_collectFlushesStaleRunsFromOtherRuns():
+    collectAction = newCollect()
+    stale = newData(1)
+    collectAction.doAction(stale)
+    staleBuffer = collectAction.buffers[id(stale["persistentData"])]
+    staleBuffer.lastTime -= 3600
+    current = newData(2)
+    collectAction.doAction(current)
+    collectAction.continueFlow.assert_called_once_with(staleBuffer)
+    assert list(collectAction.buffers) == [ id(current["persistentData"]) ]
+
+def test_collectFlushesRunsPastMaxAgeOnPostRun():
+    collectAction = newCollect()
+    collectAction.maxAge = 60
+    data = newData(1)
+    collectAction.doAction(data)
+    collectAction.buffers[id(data["persistentData"])].startTime -= 60
+    collectAction.postRun()
+    collectAction.continueFlow.assert_called_once()
+    assert collectAction.buffers == {}
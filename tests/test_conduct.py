@@ -0,0 +1,149 @@
+import json
+import asyncio
+
+import pytest
+
+from core.models import conduct
+
+def newData(var):
+    return { "flowData" : { "var" : var, "plugin" : {} }, "persistentData" : {}, "conductData" : {}, "eventData" : {} }
+
+def test_copyDataBranchesIsolatedThroughExports():
+    shared = { "k" : 1 }
+    var = { "a" : { "x" : [1] }, "b" : shared, "c" : shared, "s" : "v" }
+    data = newData(var)
+    branchA = conduct.copyData(data)
+    branchB = conduct.copyData(data)
+
+    dict(branchA["flowData"]["var"])["a"]["x"].append(2)
+    { **branchA["flowData"]["var"] }["b"]["k"] = 2
+    exported = {}
+    exported.update(branchA["flowData"]["var"])
+    exported["c"]["s"] = 3
+
+    assert json.loads(json.dumps(branchB["flowData"]["var"])) == { "a" : { "x" : [1] }, "b" : { "k" : 1 }, "c" : { "k" : 1 }, "s" : "v" }
+    assert var == { "a" : { "x" : [1] }, "b" : { "k" : 1 }, "c" : { "k" : 1 }, "s" : "v" }
+    assert branchA["flowData"]["var"]["b"] is branchA["flowData"]["var"]["c"]
+
+def test_copyDataSourceKeepsItsObjects():
+    var = { "a" : { "x" : [1] } }
+    data = newData(var)
+    branch = conduct.copyData(data)
+    assert data["flowData"]["var"]["a"] is var["a"]
+    data["flowData"]["var"]["a"]["x"].append(2)
+    assert branch["flowData"]["var"]["a"] == { "x" : [1] }
+
+def test_copyDataChainedForks():
+    var = { "a" : { "x" : [1] } }
+    data = newData(var)
+    middle = conduct.copyData(data)
+    last = conduct.copyData(middle)
+    del middle
+    data["flowData"]["var"]["a"]["x"].append(2)
+    assert last["flowData"]["var"]["a"] == { "x" : [1] }
+
+def test_copyDataCopiesOnlyTheReadPath():
+    large = { "items" : list(range(1000)) }
+    var = { "a" : { "x" : [1], "large" : large } }
+    data = newData(var)
+    branch = conduct.copyData(data)
+    branch["flowData"]["var"]["a"]["x"].append(2)
+    assert dict.__getitem__(branch["flowData"]["var"]["a"],"large") is large
+    assert var["a"]["x"] == [1]
+
+def test_copyDataSourceReadDetachesBorrowedPaths():
+    var = { "a" : { "n" : { "x" : [1] } } }
+    data = newData(var)
+    branch = conduct.copyData(data)
+    nested = branch["flowData"]["var"]["a"]
+    data["flowData"]["var"]["a"]["n"]["x"].append(2)
+    assert nested["n"]["x"] == [1]
+    assert branch["flowData"]["var"]["a"]["n"]["x"] == [1]
+
+def test_copyDataForksHaveTheirOwnLock():
+    data = newData({ "a" : {} })
+    branch = conduct.copyData(data)
+    assert branch["flowData"]["var"].lock is not data["flowData"]["var"].lock
+
+def test_copyDataSourceReplacingAliasedValueKeepsForksIsolated():
+    nested = { "x" : [1] }
+    var = { "a" : { "nested" : nested }, "b" : nested }
+    data = newData(var)
+    branch = conduct.copyData(data)
+    data["flowData"]["var"]["a"] = {}
+    data["flowData"]["var"]["b"]["x"].append(2)
+    assert branch["flowData"]["var"]["a"]["nested"]["x"] == [1]
+    assert branch["flowData"]["var"]["b"]["x"] == [1]
+
+def test_triggerBatchHandlerAsyncWaitsForEveryEventBeforeRaising():
+    finished = []
+    async def triggerHandlerAsync(triggerID,data,actionIDType,flowIDType):
+        if data == 0:
+            raise ValueError()
+        await asyncio.sleep(0.05)
+        finished.append(data)
+    loadedConduct = conduct._conduct()
+    loadedConduct.triggerHandlerAsync = triggerHandlerAsync
+    with pytest.raises(ValueError):
+        asyncio.run(loadedConduct.triggerBatchHandlerAsync("trigger",[0,1,2]))
+    assert sorted(finished) == [1,2]
+
+class fakeTrigger():
+    logicString = ""
+    varDefinitions = {}
+    failOnActionFailure = False
+
+class fakeAction():
+    _id = "action"
+    name = "action"
+    enabled = True
+
+    def __init__(self):
+        self.events = []
+
+    def runHandler(self,data=None,debug=False):
+        self.events.append(data["flowData"]["event"])
+        self.flowDataKeys = set(data["flowData"])
+        return { "result" : True, "rc" : 0 }
+
+    def hasBatch(self):
+        return False
+
+    def postRun(self):
+        pass
+
+def newFlowConduct(linkLogic):
+    action = fakeAction()
+    loadedConduct = conduct._conduct()
+    loadedConduct._id = "conductID"
+    loadedConduct.flow = [
+        { "flowID" : "trigger", "type" : "trigger", "triggerID" : "triggerID", "classObject" : fakeTrigger(), "next" : [ { "flowID" : "action", "logic" : linkLogic } ] },
+        { "flowID" : "action", "type" : "action", "actionID" : "actionID", "classObject" : action, "next" : [] }
+    ]
+    plan = conduct._executionPlan(loadedConduct)
+    # Planned as a stored conduct so triggerBatchFilter is used
+    plan.codify = False
+    loadedConduct.getExecutionPlan = lambda: plan
+    return loadedConduct, action
+
+def newEvent(event,last):
+    return { "flowData" : { "var" : {}, "plugin" : {}, "event" : event, "eventStats" : { "first" : event == 0, "current" : event, "total" : 3, "last" : last } }, "persistentData" : { "system" : { "trigger" : fakeTrigger() } }, "conductData" : {}, "eventData" : {} }
+
+def test_triggerBatchFilterMatchesUnbatchedLinkResults():
+    linkLogic = 'if data["action"]["result"] == True and data["conductID"] == "conductID"'
+    batchedConduct, batchedAction = newFlowConduct(linkLogic)
+    batchedConduct.triggerBatchHandler("triggerID",[ newEvent(event,event == 2) for event in range(3) ])
+    unbatchedConduct, unbatchedAction = newFlowConduct(linkLogic)
+    for event in range(3):
+        unbatchedConduct.triggerHandler("triggerID",newEvent(event,event == 2))
+    assert unbatchedAction.events == [0,1,2]
+    assert batchedAction.events == unbatchedAction.events
+
+def test_expressionMemoIsKeptOutOfFlowData():
+    loadedConduct, action = newFlowConduct(True)
+    loadedConduct.memoizeExpressions = True
+    data = newEvent(0,True)
+    loadedConduct.triggerHandler("triggerID",data)
+    assert action.events == [0]
+    assert "expressionMemo" not in action.flowDataKeys
+    assert data["persistentData"]["system"]["expressionMemo"].events == {}
@@ -0,0 +1,18 @@
+from core import helpers
+
+def newDicts(event,expressionMemo):
+    return { "data" : { "event" : event }, "persistentData" : { "system" : { "expressionMemo" : expressionMemo } } }
+
+def test_expressionMemoKeepsValuesPerEvent():
+    expressionMemo = helpers._expressionMemo()
+    expression = helpers.compileExpression('data["event"]["a"]')
+    eventA = { "a" : 1 }
+    eventB = { "a" : 2 }
+    assert helpers.evaluateExpression(expression,newDicts(eventA,expressionMemo)) == 1
+    eventA["a"] = 3
+    assert helpers.evaluateExpression(expression,newDicts(eventB,expressionMemo)) == 2
+    # Interleaved events each keep their own values until cleared
+    assert helpers.evaluateExpression(expression,newDicts(eventA,expressionMemo)) == 1
+    expressionMemo.clear(eventA)
+    assert helpers.evaluateExpression(expression,newDicts(eventA,expressionMemo)) == 3
+    assert helpers.evaluateExpression(expression,newDicts(eventB,expressionMemo)) == 2
@@ -0,0 +1,71 @@
+import pytest
+
+import jimi
+from core import helpers
+from system import logic
+
+def newDicts(event):
+    return { "data" : { "event" : event, "var" : {} }, "eventData" : {}, "conductData" : {}, "persistentData" : {} }
+
+event = { "empty" : "", "text" : "abc", "number" : 1, "list" : ["a","b"] }
+
+@pytest.mark.parametrize("logicString,expected",[
+    ('if data["event"]["empty"] == ""',True),
+    ('if data["event"]["text"] == ""',False),
+    ('if data["event"]["text"] != ""',True),
+    ('if concat(data["event"]["text"],")") == "abc)"',True),
+    ('if contains(")",")") == True',True),
+    ('if data["event"]["number"] == 1 and',False),
+    ('if data["event"]["number"] == 1 or',False),
+    ('if data["event"]["number"] == 1 and data["event"]["text"] == "abc"',True),
+    ('if data["event"]["number"] == 2 or data["event"]["text"] == "abc"',True),
+    ('if ( data["event"]["number"] == 2 or data["event"]["number"] == 1 ) and not data["event"]["text"] == "x"',True),
+    ('if "a" in data["event"]["list"]',True),
+    ('if "c" not in data["event"]["list"]',True),
+    ('if data["event"]["text"] match "^a.c$"',True),
+    ('if data["event"]["missing"] == None',True),
+    ('if True',True),
+    ('if False',False),
+])
+def test_ifEvalMatchesBatchAndExplain(logicString,expected):
+    dicts = newDicts(event)
+    assert logic.ifEval(logicString,dicts) is expected
+    assert logic.ifEvalBatch(logicString,[dicts,dicts]) == [expected,expected]
+    assert bool(logic.ifEval(logicString,dicts,debug=True)[0]) is expected
+
+@pytest.mark.parametrize("logicString",[
+    'if 1 == 2 and counted() == True',
+    'if 1 == 1 or counted() == True',
+    'if not 1 == 1 and ( counted() == True or counted() == False )',
+])
+def test_ifEvalShortCircuits(logicString,monkeypatch):
+    calls = []
+    def counted():
+        calls.append(1)
+        return True
+    monkeypatch.setitem(jimi.function.systemFunctions,"counted",counted)
+    logic.ifEval(logicString,newDicts(event))
+    logic.ifEvalBatch(logicString,[newDicts(event),newDicts(event)])
+    assert calls == []
+
+def test_ifEvalBatchOnlyEvaluatesUndecidedEvents(monkeypatch):
+    calls = []
+    def counted(value):
+        calls.append(value)
+        return True
+    monkeypatch.setitem(jimi.function.systemFunctions,"counted",counted)
+    results = logic.ifEvalBatch('if data["event"]["number"] == 1 and counted(data["event"]["number"]) == True',[ newDicts({ "number" : number }) for number in (1,2,1) ])
+    assert results == [True,False,True]
+    assert calls == [1,1]
+
+@pytest.mark.parametrize("template,expected",[
+    ('%%data["event"]["text"]%%%%data["event"]["number"]%%',"abc1"),
+    ('a%%data["event"]["text"]%%b',"aabcb"),
+    ('%%data["event"]["number"]%%',1),
+    ('%%data["event"]["list"]%%',["a","b"]),
+    ('%%concat(data["event"]["text"],")")%%',"abc)"),
+    ('100%',"100%"),
+    ("",""),
+])
+def test_evalString(template,expected):
+    assert helpers.evalString(template,newDicts(event)) == expected
@@ -0,0 +1,52 @@
+import types
+from unittest import mock
+
+import jimi
+from core import scheduler, workers
+
+class fakeTrigger():
+    def __init__(self,_id):
+        self._id = _id
+        self.name = _id
+        self.nextCheck = 1
+        self.attemptCount = 0
+        self.executionCount = 0
+        self.maxDuration = 0
+        self.threaded = False
+        self.priority = 0
+        self.weight = 1
+
+    def checkHandler(self,*args):
+        pass
+
+    def update(self,fields):
+        pass
+
+def test_handlerIgnoresWorkersQueuedUnderOtherKeys(monkeypatch):
+    queuedID = "5f1b2c3d4e5f6a7b8c9d0e1f"
+    dueID = "5f1b2c3d4e5f6a7b8c9d0e2f"
+    handler = workers.workerHandler(autoStart=False)
+    handler.new("runFlow",print)
+    handler.new("debug123",print)
+    handler.new("trigger:'other'",print)
+    handler.new("trigger:'{0}'".format(queuedID),print,queueKey=("scheduler",queuedID))
+    monkeypatch.setattr(jimi.workers,"workers",handler,raising=False)
+    monkeypatch.setattr(jimi,"settings",types.SimpleNamespace(getSetting=lambda name,settingName: 0))
+
+    schedulerHandler = scheduler._scheduler("system",0)
+    collection = mock.MagicMock()
+    def getAsClass(query):
+        schedulerHandler.stopped = True
+        return [ fakeTrigger(queuedID), fakeTrigger(dueID) ]
+    trigger = mock.MagicMock()
+    trigger.return_value._dbCollection = collection
+    trigger.return_value.getAsClass.side_effect = getAsClass
+    monkeypatch.setattr(jimi,"trigger",types.SimpleNamespace(_trigger=trigger),raising=False)
+
+    schedulerHandler.handler()
+
+    collection.update_many.assert_called_once()
+    assert collection.update_many.call_args[0][0] == { "_id" : { "$in" : [ jimi.db.ObjectId(queuedID) ] } }
+    # The already queued trigger is not queued again while the due one is
+    assert handler.queuedKeys() == { "runFlow", "debug123", "trigger:'other'", ("scheduler",queuedID), ("scheduler",dueID) }
+    assert handler.queue() == 5
@@ -0,0 +1,226 @@
+import time
+import queue
+import pickle
+import asyncio
+import threading
+
+import pytest
+
+from core import workers
+
+def newWorker(name,priority=0,weight=1,queueKey=None):
+    return workers.workerHandler._worker(name,print,None,True,60,False,False,None,priority,weight,queueKey)
+
+def test_workerQueueStartsHigherPriorityFirst():
+    workerQueue = workers._workerQueue()
+    for name, priority in (("low",0),("high",5),("mid",1),("high2",5)):
+        workerQueue.append(newWorker(name,priority))
+    assert [ workerQueue.popleft().name for index in range(4) ] == ["high","high2","mid","low"]
+    assert len(workerQueue) == 0
+    with pytest.raises(IndexError):
+        workerQueue.popleft()
+
+def test_workerQueueSharesStartsByWeight():
+    workerQueue = workers._workerQueue()
+    for index in range(30):
+        workerQueue.append(newWorker("heavy",weight=2))
+    for index in range(30):
+        workerQueue.append(newWorker("light",weight=1))
+    started = [ workerQueue.popleft().name for index in range(30) ]
+    assert started.count("heavy") == 20
+    assert started.count("light") == 10
+    assert workerQueue.queuedKeys() == { "heavy", "light" }
+
+def test_workerQueueIdleKeyDoesNotBankStarts():
+    workerQueue = workers._workerQueue()
+    for index in range(10):
+        workerQueue.append(newWorker("busy"))
+    for index in range(5):
+        workerQueue.popleft()
+    for index in range(5):
+        workerQueue.append(newWorker("idle"))
+    started = [ workerQueue.popleft().name for index in range(6) ]
+    assert started.count("idle") == 3
+    assert started.count("busy") == 3
+
+def test_workerHandlerRunsQueuedWorkers():
+    handler = workers.workerHandler(concurrent=2)
+    try:
+        results = []
+        workerIDs = [ handler.new("job",results.append,(index,)) for index in range(10) ]
+        for workerID in workerIDs:
+            handler.wait(workerID)
+        assert sorted(results) == list(range(10))
+        assert handler.get(workerIDs[0]).running is False
+        assert handler.queue() == 0
+    finally:
+        handler.stop()
+
+def test_workerHandlerRunsNoMoreThanConcurrent():
+    handler = workers.workerHandler(concurrent=2)
+    release = threading.Event()
+    try:
+        workerIDs = [ handler.new("job",release.wait,(5,)) for index in range(4) ]
+        time.sleep(0.2)
+        assert handler.activeCount() == 2
+        assert handler.queue() == 2
+        release.set()
+        for workerID in workerIDs:
+            handler.wait(workerID)
+        assert handler.countIncomplete() == 0
+    finally:
+        handler.stop()
+
+def test_workerHandlerKillOnlyReachesItsWorker():
+    handler = workers.workerHandler(concurrent=1)
+    try:
+        def loop():
+            while True:
+                time.sleep(0.01)
+        killedID = handler.new("loop",loop,raiseException=False)
+        results = []
+        nextID = handler.new("next",results.append,(1,))
+        time.sleep(0.2)
+        handler.kill(killedID)
+        handler.wait(killedID)
+        handler.wait(nextID)
+        assert type(handler.getError(killedID)) is SystemExit
+        assert handler.getError(nextID) is None
+        assert results == [1]
+    finally:
+        handler.stop()
+
+def test_workerHandlerHistoryIsBounded(monkeypatch):
+    monkeypatch.setattr(workers,"workerSettings",{ "history" : 3 })
+    handler = workers.workerHandler(concurrent=1)
+    try:
+        workerIDs = [ handler.new("job",print,("",)) for index in range(6) ]
+        for workerID in workerIDs:
+            handler.wait(workerID)
+        time.sleep(0.1)
+        assert len(handler.workersFinished) == 3
+        assert handler.get(workerIDs[0]) is None
+        assert handler.get(workerIDs[-1]) is not None
+    finally:
+        handler.stop()
+
+processed = []
+
+def processTask(value):
+    processed.append(value)
+
+def test_processPoolStartRunsTasksUntilRecycled():
+    taskQueue = queue.Queue()
+    resultQueue = queue.Queue()
+    for value in (1,2,3):
+        taskQueue.put(pickle.dumps((workers.getCallReference(processTask),(value,))))
+    workers.processPoolStart(taskQueue,resultQueue,2,0)
+    assert processed == [1,2]
+    assert resultQueue.get_nowait()[::2] == (0,False)
+    assert resultQueue.get_nowait()[::2] == (0,True)
+    assert taskQueue.qsize() == 1
+
+def test_processPoolStartReportsFailures():
+    taskQueue = queue.Queue()
+    resultQueue = queue.Queue()
+    taskQueue.put(pickle.dumps((workers.getCallReference(int),("x",))))
+    taskQueue.put(None)
+    workers.processPoolStart(taskQueue,resultQueue,0,0)
+    rc, error, recycle = resultQueue.get_nowait()
+    assert rc == 1
+    assert type(error) is ValueError
+    assert recycle is False
+
+class fakeProcess():
+    def __init__(self):
+        self.alive = True
+        self.exitcode = None
+
+    def is_alive(self):
+        return self.alive
+
+    def join(self,timeout=None):
+        pass
+
+class fakeChild():
+    def __init__(self,recycleJobs,maxRSS):
+        self.process = fakeProcess()
+        self.stopped = False
+        self.terminated = False
+
+    def stop(self):
+        self.stopped = True
+
+    def terminate(self):
+        self.terminated = True
+
+    def close(self):
+        pass
+
+def test_processPoolReusesIdleChildren(monkeypatch):
+    monkeypatch.setattr(workers,"_processPoolChild",fakeChild)
+    pool = workers._processPool(2)
+    child = pool.acquire()
+    pool.release(child)
+    assert pool.acquire() is child
+    # All idle children busy so another is started, only size children are kept idle
+    children = [ child, pool.acquire(), pool.acquire() ]
+    assert len(pool.children) == 3
+    for child in children:
+        pool.release(child)
+    assert len(pool.idle) == 2
+    assert children[2].stopped is True
+    deadChild = pool.acquire()
+    deadChild.process.alive = False
+    pool.release(deadChild)
+    assert deadChild not in pool.idle
+    assert deadChild not in pool.children
+    remaining = list(pool.children)
+    pool.stop()
+    assert remaining and all([ child.terminated for child in remaining ])
+    with pytest.raises(RuntimeError):
+        pool.acquire()
+
+def test_concurrentGroupWaitAllRunsEveryJob():
+    ran = []
+    group = workers.concurrentGroup(2)
+    for index in range(6):
+        group.new(ran.append,(index,))
+    assert group.waitAll() is True
+    assert sorted(ran) == list(range(6))
+
+def test_concurrentGroupWaitAllStopsAtTimeout():
+    ran = []
+    def job(index):
+        time.sleep(0.3)
+        ran.append(index)
+    group = workers.concurrentGroup(1)
+    for index in range(10):
+        group.new(job,(index,))
+    startTime = time.time()
+    assert group.waitAll(0.5) is False
+    assert time.time() - startTime < 1.5
+    assert group.countIncomplete() <= 1
+    assert "maximum duration" in group.exceptions[0]
+    time.sleep(0.5)
+    assert len(ran) < 10
+
+def test_concurrentGroupWaitAllFailsWhenInlineJobOverruns():
+    group = workers.concurrentGroup(1)
+    group.new(time.sleep,(0.6,))
+    group.new(time.sleep,(0.6,))
+    assert group.waitAll(0.2) is False
+
+async def addOne(value):
+    await asyncio.sleep(0)
+    return value + 1
+
+def test_runCoroutineFromEventLoop():
+    async def nested():
+        return workers.runCoroutine(addOne(1))
+    assert workers.runCoroutine(nested()) == 2
+
+def test_runCoroutineFromOffloadThread():
+    async def nested():
+        return await workers.runInThread(workers.runCoroutine,addOne(2))
+    assert workers.runCoroutine(nested()) == 3